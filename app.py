@@ -1,12 +1,20 @@
+import time
+
+_started = time.perf_counter()
+
 from dash import Dash, dcc, html, Input, Output, dash_table, callback
-import plotly.express as px
-import pandas as pd
-import numpy as np
 import dash
+import flask
+
+import lazyimport   # pandas, numpy and plotly are only imported when the first dashboard is built
 
 import layouts
 import callbacks
 import config
+import datastore
+import figcache
+import httpcache
+import perf
 import sites
 import utils
 
@@ -14,6 +22,40 @@ app = Dash(__name__, title=config.title, suppress_callback_exceptions=True)
 
 server = app.server
 
+# Compression of the responses, and ETag and Cache-Control headers of the GET responses (see httpcache.py)
+server.after_request(httpcache.after_request)
+
+
+# Hit/miss counters and size of the figure cache (see figcache.py)
+@server.route('/_figcache')
+def figcache_stats():
+
+    return flask.jsonify(figcache.stats())
+
+
+# Startup time of the app and import times of the deferred modules (see lazyimport.py)
+@server.route('/_startup')
+def startup_stats():
+
+    return flask.jsonify(lazy_imports=lazyimport.enabled,
+                         startup_seconds=startup_seconds,
+                         import_times=lazyimport.import_times,
+                         pending=lazyimport.pending())
+
+
+# Timings of the callbacks (see perf.py), only served when PERF_METRICS=1
+if perf.enabled:
+
+    @server.route('/metrics')
+    def perf_metrics():
+
+        return flask.Response(perf.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+    @server.route('/_perf')
+    def perf_page():
+
+        return perf.html_page()
+
 app.layout = html.Div([
     dcc.Location(id='url', refresh=True),
     html.Div(id='page-content')
@@ -22,12 +64,17 @@ app.layout = html.Div([
 
 @callback(Output('page-content', 'children'),
           [Input('url', 'pathname')])
+@perf.instrument('display_page')
 def display_page(pathname):
 
     if pathname == '/':
         
         return layouts.home_layout
 
+    elif pathname == layouts.compare_url:
+
+        return layouts.call_compare_layout(sites.site_list)
+
     else:
 
         for site in sites.site_list:
@@ -41,32 +88,16 @@ def display_page(pathname):
         return layouts.call_layout(site_config)    
 
 
-@app.callback(Output('intermediate-value', 'data'), Input('site-config', 'data'))
+# The dataset stays on the server (see datastore.py), only its key is sent to the browser
+@app.callback(Output('dataset-key', 'data'), Input('site-config', 'data'))
+@perf.instrument('process_data')
 def process_data(site_config):
 
-    df = utils.df_process(data_file_name=site_config['data_file_name'],
-                          date_range=site_config['date_range'])
-
-    return df.to_json(date_format='iso', orient='split')
-
-
-@app.callback(Output('weather-value', 'data'), Input('site-config', 'data'))
-def clean_data(site_config):
-
-    df_temp = utils.weather_data(site_config['weather_file_name'])
-
-    return df_temp.to_json(date_format='iso', orient='split')
-
-
-@app.callback(Output('daily-notes', 'data'), Input('site-config', 'data'))
-def add_notes(site_config):
-
-    df_temp = utils.note_data(site_config['note_file_name'])
-
-    return df_temp.to_json(date_format='iso', orient='split')
+    return datastore.dataset_key(site_config)
 
 
 @app.callback(Output('site-config', 'data'), Input('url', 'pathname'))
+@perf.instrument('clean_data')
 def clean_data(pathname):
 
     for site in sites.site_list:
@@ -82,6 +113,9 @@ def clean_data(pathname):
     return site_config
 
 
+startup_seconds = time.perf_counter() - _started
+
+
 if __name__ == '__main__':
     app.run(debug=False)
     # app.run(debug=True)
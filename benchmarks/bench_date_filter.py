@@ -0,0 +1,54 @@
+# Micro-benchmark of the date range filtering of utils.df_filter:
+# formatting every timestamp as a string vs. a binary search on the index
+#
+# Run from the repository root with:
+#
+#     python benchmarks/bench_date_filter.py
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import utils
+
+
+# The string-based filter used before (kept here for the comparison)
+def strftime_filter(df, start_date, end_date):
+
+    return df[(df.index.strftime("%Y-%m-%d") >= start_date) &
+              (df.index.strftime("%Y-%m-%d") <= end_date)]
+
+
+def best_time(func, number):
+
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+if __name__ == '__main__':
+
+    print('{:>10} {:>14} {:>14} {:>9}'.format('rows', 'strftime (ms)', 'search (ms)', 'speedup'))
+
+    for rows in [1_000, 10_000, 100_000, 1_000_000]:
+
+        index = pd.date_range('2020-01-01', periods=rows, freq='15T')
+
+        df = pd.DataFrame({'in': np.ones(rows), 'out': np.ones(rows)}, index=index)
+
+        # select the middle half of the series
+        start_date = index[rows // 4].strftime('%Y-%m-%d')
+        end_date = index[3 * rows // 4].strftime('%Y-%m-%d')
+
+        assert strftime_filter(df, start_date, end_date).index.equals(
+            utils.df_select(df, start_date, end_date).index)
+
+        number = max(1, 100_000 // rows)
+
+        t_old = best_time(lambda: strftime_filter(df, start_date, end_date), number)
+        t_new = best_time(lambda: utils.df_select(df, start_date, end_date), number * 100)
+
+        print('{:>10,} {:>14.3f} {:>14.3f} {:>8.0f}x'.format(rows, t_old * 1e3, t_new * 1e3, t_old / t_new))
@@ -0,0 +1,67 @@
+# Memory benchmark of the 15-min counter data: the dataframe built by df_process
+# (DatetimeIndex + float64 'in', 'out' and 'bi_direction' columns) vs. what a
+# dataset keeps instead: the compact series of counterseries.py and the hourly
+# statistics by day of week of weekstats.py (matrices, cumulative arrays, prefix
+# sums and range maximum tables)
+#
+# Run from the repository root with:
+#
+#     python benchmarks/bench_memory.py
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+import counterseries
+import sites
+import utils
+import weekstats
+
+
+# A function to make a compact series of random counts over a number of years
+def synthetic_series(years, seed=0):
+
+    rng = np.random.default_rng(seed)
+
+    slots = years * 365 * counterseries.slots_per_day
+
+    missing = np.zeros(slots, dtype=bool)
+    missing[slots // 3: slots // 3 + 160 * counterseries.slots_per_day] = True   # a 160-day outage
+
+    return dict(start=pd.Timestamp('2020-01-01'),
+                step=pd.Timedelta(minutes=15),
+                slots=slots,
+                counts={col: rng.poisson(3, slots).astype(np.uint16) for col in ['in', 'out']},
+                missing={col: np.packbits(missing) for col in ['in', 'out']})
+
+
+# A function to print the memory used by the dataframe and by the compact data of a series
+def report(name, series):
+
+    frame = counterseries.to_frame(series).memory_usage(deep=True).sum()
+
+    compact = counterseries.nbytes(series)
+
+    stats = weekstats.nbytes(weekstats.build(series))
+
+    print('{:<28} {:>10,} {:>14,} {:>12,} {:>12,} {:>12,} {:>7.1f}x'.format(
+        name, series['slots'], frame, compact, stats, compact + stats, frame / (compact + stats)))
+
+
+if __name__ == '__main__':
+
+    print('{:<28} {:>10} {:>14} {:>12} {:>12} {:>12} {:>8}'.format(
+        'series', 'slots', 'frame (B)', 'series (B)', 'stats (B)', 'compact (B)', 'ratio'))
+
+    for site in sites.site_list:
+
+        report(site['site_url'], utils.counter_series(site['data_file_name'], site['date_range']))
+
+    for years in [1, 5, 10]:
+
+        report('synthetic {} year(s)'.format(years), synthetic_series(years))
@@ -0,0 +1,133 @@
+# Payload benchmark of the figures: JSON size of every chart of every site as plotly
+# serializes it vs. the compact figure of compactfig.py, and a check that the compact
+# figure holds the same data (times, values and hover fields)
+#
+# Run from the repository root with:
+#
+#     python benchmarks/bench_payload.py
+
+import gzip
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+import callbacks
+import compactfig
+import config
+import datastore
+import sites
+
+
+# A function to get the times of the points of a compact trace
+def compact_times(trace, n):
+
+    if 'x0' in trace and 'x' not in trace:
+        return pd.Timestamp(trace['x0']).to_datetime64() + np.arange(n) * np.timedelta64(int(trace['dx']), 'ms')
+
+    return pd.DatetimeIndex(trace['x']).to_numpy()
+
+
+# A function to render the customdata placeholders of the hovertemplate of a trace for one
+# point (the day of week read from the time in a compact trace), with their format
+def render_hover(trace, times, point):
+
+    customdata = trace.get('customdata')
+
+    def replace(match):
+        return '<{}{}>'.format(customdata[point][int(match.group(1))], match.group(2))
+
+    text = re.sub(r'%\{customdata\[(\d+)\]([^}]*)\}', replace, trace.get('hovertemplate', ''))
+
+    return text.replace('%{x|%a}', '<{}>'.format(config.weekday_list[pd.Timestamp(times[point]).dayofweek]))
+
+
+# A function to check that a compact trace holds the data of the original trace
+def check_trace(original, compact):
+
+    times = compactfig._times(compactfig._array(original['x'])) if 'x' in original else None
+
+    if times is not None and len(times) >= compactfig.min_length:
+
+        assert (compact_times(compact, len(times)) == times).all(), 'times'
+
+        if 'customdata' in original:
+
+            customdata = np.asarray(original['customdata'], dtype=object)
+            day_names = np.array(config.weekday_list, dtype=object)[pd.DatetimeIndex(times).dayofweek]
+            kept = [customdata[:, i] for i in range(customdata.shape[1]) if not (customdata[:, i] == day_names).all()]
+
+            if kept:
+                assert pd.DataFrame(np.column_stack(kept)).equals(pd.DataFrame(np.asarray(compact['customdata'], dtype=object))), 'customdata'
+
+            # the hover text of every point reads the same values
+            for point in np.linspace(0, len(times) - 1, min(len(times), 200)).astype(int):
+                assert render_hover(original, times, point) == render_hover(compact, times, point), 'hovertemplate'
+
+    for key, value in original.items():
+
+        if key in ['x', 'customdata', 'hovertemplate'] or key not in compact:
+            continue
+
+        if isinstance(value, dict) and 'bdata' not in value:
+            continue
+
+        if isinstance(value, (list, tuple, np.ndarray, dict)):
+
+            before, after = compactfig._array(value), compactfig._array(compact[key])
+
+            if before.dtype.kind in 'iuf':
+                assert np.array_equal(before.astype(float), after.astype(float), equal_nan=True), key
+
+
+# A function to get the JSON size of a figure, raw and gzip compressed
+def sizes(figure):
+
+    text = to_json_plotly(figure).encode()
+
+    return len(text), len(gzip.compress(text))
+
+
+def main():
+
+    figures = {'bar_figure/' + agg: (lambda shared, site, agg=agg: callbacks.bar_figure(shared, site, 'bi_direction', agg, None))
+               for agg in ['15_min', '30_min', '1_hour', '1_day', '1_week', '1_month']}
+
+    figures.update({
+        'time_of_day_figure': lambda shared, site: callbacks.time_of_day_figure(shared, site, 'bi_direction', config.weekday_list),
+        'day_of_week_figure': lambda shared, site: callbacks.day_of_week_figure(shared, site, 'bi_direction'),
+        'avg_hour_figure': lambda shared, site: callbacks.avg_hour_figure(shared, site, 'bi_direction'),
+        'weather_figure': lambda shared, site: callbacks.weather_figure(shared, site, 'bi_direction', config.weekday_list, 'All days')})
+
+    print('typed arrays: {}\n'.format('on' if compactfig.typed_arrays else 'off (dash < 2.15)'))
+
+    print('{:<14} {:<22} {:>12} {:>12} {:>8} {:>14} {:>14}'.format(
+        'site', 'figure', 'before (kB)', 'after (kB)', 'ratio', 'gzip before', 'gzip after'))
+
+    for site in sites.site_list:
+
+        shared = callbacks.shared_data(datastore.get(datastore.dataset_key(site)), *site['date_range'])
+
+        for name, build in figures.items():
+
+            figure = build(shared, site)
+
+            compact = compactfig.compact(figure)
+
+            for original, trace in zip(figure.to_plotly_json()['data'], compact['data']):
+                check_trace(original, trace)
+
+            (before, gzip_before), (after, gzip_after) = sizes(figure), sizes(compact)
+
+            print('{:<14} {:<22} {:>12.1f} {:>12.1f} {:>8.2f} {:>14.1f} {:>14.1f}'.format(
+                site['site_url'], name, before / 1000, after / 1000, after / before, gzip_before / 1000, gzip_after / 1000))
+
+
+if __name__ == '__main__':
+    main()
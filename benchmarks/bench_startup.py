@@ -0,0 +1,116 @@
+# Cold-start benchmark of a web worker: time from starting a new Python process
+# to the first served page, with and without the deferred imports of lazyimport.py
+#
+# Each run starts a fresh process which imports the app, serves the home page
+# (the page, its layout and its callbacks) and then builds the first dashboard.
+#
+# Run from the repository root with:
+#
+#     python benchmarks/bench_startup.py [runs]
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+# The part run in the new process: prints a line when the first page is served,
+# then a line with the timings of the steps
+def child():
+
+    tic = time.perf_counter()
+
+    import app
+
+    imported = time.perf_counter()
+
+    client = app.server.test_client()
+
+    for path in ['/', '/_dash-layout', '/_dash-dependencies']:
+        assert client.get(path).status_code == 200
+
+    response = client.post('/_dash-update-component', json={
+        'output': 'page-content.children',
+        'outputs': {'id': 'page-content', 'property': 'children'},
+        'inputs': [{'id': 'url', 'property': 'pathname', 'value': '/'}],
+        'changedPropIds': ['url.pathname']})
+
+    assert response.status_code == 200
+
+    served = time.perf_counter()
+
+    print('served', flush=True)
+
+    import callbacks
+    import datastore
+    import sites
+
+    site = sites.site_list[0]
+
+    shared = callbacks.shared_data(datastore.get(datastore.dataset_key(site)), *site['date_range'])
+
+    callbacks.bar_figure(shared, site, 'bi_direction', '1_day', None)
+
+    dashboard = time.perf_counter()
+
+    print(json.dumps(dict(import_app=imported - tic,
+                          first_page=served - tic,
+                          first_dashboard=dashboard - served,
+                          import_times=app.lazyimport.import_times)), flush=True)
+
+
+# A function to time a cold start in a new process
+def cold_start(lazy):
+
+    env = dict(os.environ, LAZY_IMPORTS='1' if lazy else '0', FIGURE_CACHE_SIZE_MB='0')
+
+    tic = time.perf_counter()
+
+    process = subprocess.Popen([sys.executable, '-W', 'ignore', __file__, '--child'],
+                               cwd=root, env=env, stdout=subprocess.PIPE, text=True)
+
+    assert process.stdout.readline().strip() == 'served'
+
+    to_first_page = time.perf_counter() - tic
+
+    result = json.loads(process.stdout.readline())
+
+    process.wait()
+
+    return dict(result, process_to_first_page=to_first_page)
+
+
+if __name__ == '__main__':
+
+    if sys.argv[1:] == ['--child']:
+
+        sys.path.insert(0, root)
+
+        child()
+
+        sys.exit()
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    cold_start(True)   # warm up the disk cache and the data cache
+
+    print('{:>14} {:>16} {:>16} {:>18}'.format('lazy imports', 'import app (s)', 'first page (s)', 'first dashboard (s)'))
+
+    for lazy in [False, True]:
+
+        results = [cold_start(lazy) for _ in range(runs)]
+
+        print('{:>14} {:>16.3f} {:>16.3f} {:>18.3f}'.format(
+            'on' if lazy else 'off',
+            statistics.median(r['import_app'] for r in results),
+            statistics.median(r['process_to_first_page'] for r in results),
+            statistics.median(r['first_dashboard'] for r in results)))
+
+        if lazy:
+            print('\nimport times of the deferred modules on first use (s, last run):')
+            for name, seconds in results[-1]['import_times'].items():
+                print('  {:<24} {:.3f}'.format(name, seconds))
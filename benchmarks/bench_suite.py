@@ -0,0 +1,329 @@
+# Benchmark suite of the data loading and the callback hot paths, on synthetic data
+#
+# Synthetic sites are generated in a temporary folder laid out like data/: 15-min
+# counter exports (csv, with daily, weekly and seasonal cycles and a 120-day
+# outage), daily weather and notes, and a sites.json listing them. The suite then
+# times, at p50 and p95 over a number of runs:
+#
+#   - for sites of 1, 5 and 10 years of data: building the counter cache,
+#     df_process, weather_data, df_update at every resample rule, loading the
+#     dataset, slicing the selected dates and every figure and table callback
+#     (called directly, without the figure cache)
+#   - for 1, 10 and 100 sites of a year of data: pre-warming the caches of all
+#     the sites, loading their datasets and the multi-site daily matrix
+#
+# The results can be written as JSON and compared with an earlier run: the
+# benchmarks whose p50 grew by more than the threshold are listed as
+# regressions and the exit status is 1.
+#
+# Run from the repository root with:
+#
+#     python benchmarks/bench_suite.py [--years 1 5 10] [--sites 1 10 100] [--repeat 20]
+#                                      [--output results.json] [--compare baseline.json] [--threshold 0.25]
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, root)
+
+weekday_list = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+first_day = pd.Timestamp('2015-01-01')
+
+agg_radio_vals = ['15_min', '30_min', '1_hour', '1_day', '1_week', '1_month']
+
+rules = ['15T', '30T', 'H', 'D', 'W', 'M']
+
+
+# A function to write a synthetic counter export: morning and evening peaks on
+# weekdays, a midday hump on weekends, more traffic in summer, no rows during
+# a 120-day outage (for exports of more than a year)
+def write_counter(path, days, seed):
+
+    rng = np.random.default_rng(seed)
+
+    times = pd.date_range(first_day, periods=days * 96, freq='15T')
+
+    hour = times.hour.to_numpy() + times.minute.to_numpy() / 60
+
+    weekend = times.dayofweek.to_numpy() >= 5
+
+    commute = np.exp(-(hour - 8) ** 2 / 2) + np.exp(-(hour - 17) ** 2 / 2)
+    leisure = np.exp(-(hour - 13) ** 2 / 8)
+
+    season = 1 + 0.6 * np.sin(2 * np.pi * (times.dayofyear.to_numpy() - 100) / 365)
+
+    rate = 0.1 + 4 * season * np.where(weekend, leisure, commute)
+
+    df = pd.DataFrame({'time': times.strftime('%Y-%m-%d %H:%M'),
+                       'in': rng.poisson(rate),
+                       'out': rng.poisson(0.8 * rate)})
+
+    if days > 365:
+        outage = (times >= first_day + pd.Timedelta(days=days // 2)) & (times < first_day + pd.Timedelta(days=days // 2 + 120))
+        df = df[~outage]
+
+    df.to_csv(path, index=False, header=['Flow Name', 'Synthetic Cyclist IN', 'Synthetic Cyclist OUT'])
+
+
+# A function to write synthetic daily weather and notes
+def write_weather_and_notes(weather_path, notes_path, days, seed):
+
+    rng = np.random.default_rng(seed)
+
+    dates = pd.date_range(first_day, periods=days, freq='D')
+
+    tmax = 58 + 25 * np.sin(2 * np.pi * (dates.dayofyear.to_numpy() - 100) / 365) + rng.normal(0, 6, days)
+
+    pd.DataFrame({'STATION': 'SYNTHETIC',
+                  'NAME': 'SYNTHETIC, MI US',
+                  'DATE': dates.strftime('%Y-%m-%d'),
+                  'PRCP': np.where(rng.random(days) < 0.3, rng.exponential(0.3, days), 0).round(2),
+                  'SNOW': 0.0,
+                  'SNWD': 0.0,
+                  'TMAX': tmax.round(),
+                  'TMIN': (tmax - 15 - rng.normal(0, 4, days)).round()}).to_csv(weather_path, index=False)
+
+    notes = np.where(dates.day == 1, 'First of the month', ' ')
+
+    pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'notes': notes}).to_csv(notes_path, index=False)
+
+
+# A function to describe a synthetic site of a number of years of data
+def site_config(name, years):
+
+    days = years * 365
+
+    return {'site_url': '/' + name,
+            'site_title': 'Synthetic site ' + name,
+            'data_file_name': name + '.csv',
+            'weather_file_name': 'weather-' + name + '.csv',
+            'note_file_name': 'notes-' + name + '.csv',
+            'config_direction': {'in': 'Northbound', 'out': 'Southbound'},
+            'loc_msg_markdown': '',
+            'dates_msg': '',
+            'date_range': [str(first_day.date()), str((first_day + pd.Timedelta(days=days - 1)).date())],
+            'default_res': '1_day'}
+
+
+# A function to generate the synthetic data folder: one site per number of years,
+# and the sites of the largest multi-site group
+def generate(folder, years_list, sites_list):
+
+    for sub in ['counter', 'weather', 'notes', 'cache']:
+        os.makedirs(os.path.join(folder, 'data', sub), exist_ok=True)
+
+    singles = {years: site_config('synthetic-{}y'.format(years), years) for years in years_list}
+
+    group = [site_config('synthetic-site-{:03d}'.format(i), 1) for i in range(max(sites_list, default=0))]
+
+    for seed, site in enumerate([*singles.values(), *group]):
+
+        days = (pd.Timestamp(site['date_range'][1]) - first_day).days + 1
+
+        write_counter(os.path.join(folder, 'data', 'counter', site['data_file_name']), days, seed)
+
+        write_weather_and_notes(os.path.join(folder, 'data', 'weather', site['weather_file_name']),
+                                os.path.join(folder, 'data', 'notes', site['note_file_name']), days, seed)
+
+    with open(os.path.join(folder, 'data', 'sites.json'), 'w') as f:
+        json.dump([*singles.values(), *group], f, indent=4)
+
+    return singles, group
+
+
+# A function to time a function over a number of runs (with a setup run before each one)
+def measure(results, name, func, repeat, setup=None):
+
+    times = []
+
+    for _ in range(repeat):
+
+        if setup is not None:
+            setup()
+
+        tic = time.perf_counter()
+
+        func()
+
+        times.append(time.perf_counter() - tic)
+
+    p50, p95 = np.percentile(times, [50, 95])
+
+    results[name] = dict(n=repeat, p50=p50, p95=p95, min=min(times), mean=sum(times) / len(times))
+
+    print('{:<50} n={:<4} p50 {:9.2f} ms   p95 {:9.2f} ms'.format(name, repeat, p50 * 1000, p95 * 1000), flush=True)
+
+
+# The benchmarks of a site
+def bench_site(results, prefix, site, repeat, cold_repeat):
+
+    import callbacks
+    import datacache
+    import datastore
+    import utils
+
+    date_range = site['date_range']
+
+    def clear_cache():
+        shutil.rmtree(datacache.cache_path(site['data_file_name'], date_range), ignore_errors=True)
+
+    measure(results, prefix + 'datacache.build', lambda: datacache.ensure(site['data_file_name'], date_range),
+            cold_repeat, setup=clear_cache)
+
+    measure(results, prefix + 'df_process', lambda: utils.df_process(site['data_file_name'], date_range), repeat)
+
+    measure(results, prefix + 'weather_data', lambda: utils.weather_data(site['weather_file_name']), repeat)
+
+    df = utils.df_process(site['data_file_name'], date_range)
+
+    for rule in rules:
+        measure(results, prefix + 'df_update/' + rule, lambda: utils.df_update(df, rule, *date_range), repeat)
+
+    key = datastore.dataset_key(site)
+
+    measure(results, prefix + 'datastore.get (cold)', lambda: datastore.get(key), cold_repeat,
+            setup=datastore._datasets.clear)
+
+    measure(results, prefix + 'shared_data', lambda: callbacks.shared_data(datastore.get(key), *date_range), repeat)
+
+    shared = callbacks.shared_data(datastore.get(key), *date_range)
+
+    for agg in agg_radio_vals:
+        measure(results, prefix + 'bar_figure/' + agg,
+                lambda: callbacks.bar_figure(shared, site, 'bi_direction', agg, None), repeat)
+
+    figures = {'summary_table': lambda: callbacks.summary_table(shared, site),
+               'peak_table': lambda: callbacks.peak_table(shared, site),
+               'time_of_day_figure': lambda: callbacks.time_of_day_figure(shared, site, 'bi_direction', weekday_list),
+               'day_of_week_figure': lambda: callbacks.day_of_week_figure(shared, site, 'bi_direction'),
+               'avg_hour_figure': lambda: callbacks.avg_hour_figure(shared, site, 'bi_direction'),
+               'weather_figure': lambda: callbacks.weather_figure(shared, site, 'bi_direction', weekday_list, 'All days')}
+
+    for name, func in figures.items():
+        measure(results, prefix + name, func, repeat)
+
+
+# The benchmarks of a group of sites
+def bench_sites(results, prefix, site_list, repeat, cold_repeat):
+
+    import datacache
+    import datastore
+    import multisite
+
+    def clear_caches():
+        for site in site_list:
+            shutil.rmtree(datacache.cache_path(site['data_file_name'], site['date_range']), ignore_errors=True)
+
+    measure(results, prefix + 'datacache.warm', lambda: datacache.warm(site_list), cold_repeat, setup=clear_caches)
+
+    def preload():
+        for site in site_list:
+            datastore.get(datastore.dataset_key(site))
+
+    measure(results, prefix + 'datastore.get (cold)', preload, cold_repeat, setup=datastore._datasets.clear)
+
+    start_date, end_date = site_list[0]['date_range']
+
+    measure(results, prefix + 'multisite.daily_matrix (cold)',
+            lambda: multisite.daily_matrix(site_list, start_date, end_date, 'bi_direction'),
+            cold_repeat, setup=datastore._datasets.clear)
+
+    measure(results, prefix + 'multisite.daily_matrix',
+            lambda: multisite.daily_matrix(site_list, start_date, end_date, 'bi_direction'), repeat)
+
+
+# A function to list the benchmarks whose p50 grew by more than a threshold (a fraction) since a baseline run
+def regressions(results, baseline, threshold):
+
+    found = []
+
+    for name, result in results.items():
+
+        before = baseline['results'].get(name)
+
+        if before is not None and result['p50'] > before['p50'] * (1 + threshold):
+            found.append((name, before['p50'], result['p50']))
+
+    return found
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the data loading and the callbacks on synthetic data.')
+    parser.add_argument('--years', type=int, nargs='*', default=[1, 5, 10], help='years of data of the single sites')
+    parser.add_argument('--sites', type=int, nargs='*', default=[1, 10, 100], help='numbers of sites of a year of data')
+    parser.add_argument('--repeat', type=int, default=20, help='runs of each benchmark')
+    parser.add_argument('--cold-repeat', type=int, default=3, help='runs of the benchmarks starting from an empty cache')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='p50 increase flagged as a regression (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='bench-suite-')
+
+    try:
+
+        tic = time.perf_counter()
+
+        singles, group = generate(folder, args.years, args.sites)
+
+        print('synthetic data generated in {:.1f} s'.format(time.perf_counter() - tic))
+
+        os.chdir(folder)   # the modules read ./data/ (sites.json, counter exports, weather and notes)
+
+        results = {}
+
+        for years, site in singles.items():
+            bench_site(results, '{}y/'.format(years), site, args.repeat, args.cold_repeat)
+
+        for n in args.sites:
+            bench_sites(results, '{}sites/'.format(n), group[:n], args.repeat, args.cold_repeat)
+
+    finally:
+        os.chdir(root)
+        shutil.rmtree(folder, ignore_errors=True)
+
+    import plotly
+
+    run = dict(time=datetime.datetime.now().isoformat(timespec='seconds'),
+               python=platform.python_version(),
+               platform=platform.platform(),
+               versions=dict(numpy=np.__version__, pandas=pd.__version__, plotly=plotly.__version__),
+               args=vars(args),
+               results=results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.compare:
+
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        found = regressions(results, baseline, args.threshold)
+
+        for name, before, after in found:
+            print('REGRESSION {:<50} p50 {:9.2f} ms -> {:9.2f} ms ({:+.0%})'.format(
+                name, before * 1000, after * 1000, after / before - 1))
+
+        print('{} regression(s) beyond {:.0%} against {}'.format(len(found), args.threshold, args.compare))
+
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+# Load test of the app over HTTP: virtual users replaying the callback requests of a browser
+#
+# Boots the app locally (gunicorn with gunicorn.conf.py, or the Flask development
+# server if gunicorn is not installed) or targets a running server (--url), then
+# runs a number of concurrent virtual users. Each user repeats a session on a
+# random site, sending the /_dash-update-component requests the browser sends:
+#
+#   - page load: the page layout, the site config, the dataset key and the
+#     first call of the dashboard callback
+#   - a change of the selected dates (random dates in the site's date range)
+#   - a switch to the 15 min resolution, then back to the default resolution
+#   - toggles of the direction
+#
+# The requests are sent with a small asyncio HTTP/1.1 client (no dependency
+# beyond the standard library). Reports the throughput, the latency percentiles
+# of each step and the response sizes of each callback output (the outputs
+# left unchanged by a call are not counted).
+#
+# Run from the repository root with:
+#
+#     python benchmarks/load_test.py [--users 8] [--duration 30] [--workers 2]
+#                                    [--no-figure-cache] [--url http://host:port] [--output results.json]
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, root)
+
+percentiles = [50, 90, 95, 99]
+
+
+# A function to start the app in a new process and wait until it serves the home page
+def start_server(port, workers, env):
+
+    try:
+        import gunicorn   # noqa: F401
+        cmd = [sys.executable, '-m', 'gunicorn', 'app:server', '--bind', '127.0.0.1:{}'.format(port),
+               '--workers', str(workers), '--log-level', 'warning']
+    except ImportError:
+        print('gunicorn is not installed, using the Flask development server (threaded)')
+        cmd = [sys.executable, '-W', 'ignore', '-c',
+               'import logging, app; logging.getLogger("werkzeug").setLevel(logging.WARNING); '
+               'app.server.run(host="127.0.0.1", port={}, threaded=True)'.format(port)]
+
+    process = subprocess.Popen(cmd, cwd=root, env=env, stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 120
+
+    while time.monotonic() < deadline:
+
+        if process.poll() is not None:
+            raise RuntimeError('the server exited with status {}'.format(process.returncode))
+
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:{}/'.format(port), timeout=5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+
+    process.terminate()
+
+    raise RuntimeError('the server did not start')
+
+
+# A function to send a request and read the response (HTTP/1.1, the connection is reopened
+# when the server closes it). Returns the status, the body and the new connection.
+async def http_request(url, conn, method, path, body=None):
+
+    data = b'' if body is None else json.dumps(body).encode()
+
+    if conn is None:
+        conn = await asyncio.open_connection(url.hostname, url.port)
+
+    reader, writer = conn
+
+    writer.write('{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'.format(
+        method, path, url.netloc, len(data)).encode() + data)
+
+    await writer.drain()
+
+    status_line = await reader.readline()
+
+    version, status = status_line.split()[:2]
+
+    headers = {}
+
+    while True:
+
+        line = await reader.readline()
+
+        if line in (b'\r\n', b'\n', b''):
+            break
+
+        name, value = line.decode('latin-1').split(':', 1)
+
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding') == 'chunked':
+
+        chunks = []
+
+        while True:
+
+            size = int((await reader.readline()).split(b';')[0], 16)
+
+            if size == 0:
+                await reader.readline()
+                break
+
+            chunks.append(await reader.readexactly(size))
+
+            await reader.readline()
+
+        content = b''.join(chunks)
+
+    elif 'content-length' in headers:
+        content = await reader.readexactly(int(headers['content-length']))
+
+    else:
+        content = await reader.read()
+
+    keep_alive = (version == b'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                  and ('content-length' in headers or headers.get('transfer-encoding') == 'chunked'))
+
+    if not keep_alive:
+        writer.close()
+        conn = None
+
+    return int(status), content, conn
+
+
+# A function to find the outputs ([id, property] pairs) of an output string of /_dash-dependencies
+def parse_outputs(output):
+
+    return [part.rsplit('.', 1) for part in output.strip('.').split('...')]
+
+
+# A function to find the initial values of the controls in a layout (a component tree)
+def initial_values(component, values):
+
+    if isinstance(component, list):
+        for child in component:
+            initial_values(child, values)
+
+    elif isinstance(component, dict):
+
+        props = component.get('props', {})
+
+        if 'id' in props and isinstance(props['id'], str):
+            for prop, value in props.items():
+                values[(props['id'], prop)] = value
+
+        initial_values(props.get('children'), values)
+
+    return values
+
+
+stats = dict(requests=0, sessions=0, steps={}, outputs={})   # the requests of all the virtual users
+
+
+# A virtual user: its connection and the values of the controls of its page
+def new_user(url, deps, rng):
+
+    return dict(url=url, deps=deps, rng=rng, conn=None, values={})
+
+
+# A function to send the call of a callback (by one of its outputs) with the current values of
+# its inputs, and record its latency and the sizes of its outputs under a step name
+async def call(user, output_key, step, changed=()):
+
+    dep = user['deps'][output_key]
+
+    values = user['values']
+
+    body = dict(output=dep['output'],
+                outputs=[dict(id=i, property=p) for i, p in parse_outputs(dep['output'])],
+                inputs=[dict(id=i['id'], property=i['property'], value=values.get((i['id'], i['property'])))
+                        for i in dep['inputs']],
+                state=[dict(id=i['id'], property=i['property'], value=values.get((i['id'], i['property'])))
+                       for i in dep['state']],
+                changedPropIds=list(changed))
+
+    if len(body['outputs']) == 1:
+        body['outputs'] = body['outputs'][0]
+
+    tic = time.perf_counter()
+
+    status, content, user['conn'] = await http_request(user['url'], user['conn'], 'POST',
+                                                       '/_dash-update-component', body)
+
+    latency = time.perf_counter() - tic
+
+    stats['requests'] += 1
+
+    step_stats = stats['steps'].setdefault(step, dict(latency=[], bytes=[], errors=0))
+
+    if status not in (200, 204):
+        step_stats['errors'] += 1
+        return
+
+    step_stats['latency'].append(latency)
+    step_stats['bytes'].append(len(content))
+
+    if status == 204:
+        return
+
+    response = json.loads(content)['response']
+
+    for component_id, props in response.items():
+
+        for prop, value in props.items():
+
+            values[(component_id, prop)] = value
+
+            output = '{}.{}'.format(component_id, prop)
+
+            stats['outputs'].setdefault(output, []).append(len(json.dumps(value, separators=(',', ':'))))
+
+
+# A function to run the sessions of a virtual user until a deadline
+async def run_user(user, site_list, deadline):
+
+    rng = user['rng']
+
+    while time.monotonic() < deadline:
+
+        site = rng.choice(site_list)
+
+        user['values'] = {('url', 'pathname'): site['site_url']}
+
+        # page load
+        await call(user, 'page-content.children', 'page layout')
+
+        initial_values(user['values'].get(('page-content', 'children')), user['values'])
+
+        await call(user, 'site-config.data', 'site config')
+        await call(user, 'dataset-key.data', 'dataset key')
+        await call(user, 'dashboard', 'dashboard: page load')
+
+        # a change of the selected dates
+        first, last = (datetime.date.fromisoformat(day) for day in site['date_range'])
+        start, end = sorted(first + datetime.timedelta(days=rng.randint(0, (last - first).days)) for _ in range(2))
+
+        user['values'][('my-date-picker-range', 'start_date')] = start.isoformat()
+        user['values'][('my-date-picker-range', 'end_date')] = end.isoformat()
+
+        await call(user, 'dashboard', 'dashboard: dates',
+                   ['my-date-picker-range.start_date', 'my-date-picker-range.end_date'])
+
+        # the 15 min resolution and back
+        default_res = user['values'][('data-agg-radio', 'value')]
+
+        for res in ['15_min', default_res]:
+            user['values'][('data-agg-radio', 'value')] = res
+            await call(user, 'dashboard', 'dashboard: resolution', ['data-agg-radio.value'])
+
+        # the directions
+        for direction in ['in', 'out', 'bi_direction']:
+            user['values'][('data-dir-radio', 'value')] = direction
+            await call(user, 'dashboard', 'dashboard: direction', ['data-dir-radio.value'])
+
+        stats['sessions'] += 1
+
+    if user['conn'] is not None:
+        user['conn'][1].close()
+
+
+# A function to get percentiles of a list of values (nearest rank)
+def percentile_values(values):
+
+    values = sorted(values)
+
+    return {p: values[min(len(values) * p // 100, len(values) - 1)] for p in percentiles} if values else {}
+
+
+# A function to summarize the recorded requests
+def summary(elapsed):
+
+    steps = {step: dict(requests=len(s['latency']) + s['errors'],
+                        errors=s['errors'],
+                        latency_ms={p: v * 1000 for p, v in percentile_values(s['latency']).items()},
+                        bytes=percentile_values(s['bytes']))
+             for step, s in stats['steps'].items()}
+
+    outputs = {output: dict(updates=len(sizes), bytes=percentile_values(sizes))
+               for output, sizes in sorted(stats['outputs'].items())}
+
+    return dict(seconds=elapsed,
+                requests=stats['requests'],
+                sessions=stats['sessions'],
+                requests_per_second=stats['requests'] / elapsed,
+                steps=steps,
+                outputs=outputs)
+
+
+def report(result):
+
+    print('\n{} requests, {} sessions in {:.1f} s: {:.1f} requests/s'.format(
+        result['requests'], result['sessions'], result['seconds'], result['requests_per_second']))
+
+    print('\n{:<26} {:>8} {:>7}'.format('step', 'requests', 'errors') +
+          ''.join('{:>10}'.format('p{} ms'.format(p)) for p in percentiles) + '{:>12}'.format('p50 kB'))
+
+    for step, s in result['steps'].items():
+        print('{:<26} {:>8} {:>7}'.format(step, s['requests'], s['errors']) +
+              ''.join('{:>10.1f}'.format(s['latency_ms'].get(p, float('nan'))) for p in percentiles) +
+              '{:>12.1f}'.format(s['bytes'].get(50, 0) / 1000))
+
+    print('\n{:<30} {:>8}'.format('output', 'updates') + ''.join('{:>10}'.format('p{} kB'.format(p)) for p in percentiles))
+
+    for output, s in result['outputs'].items():
+        print('{:<30} {:>8}'.format(output, s['updates']) +
+              ''.join('{:>10.1f}'.format(s['bytes'][p] / 1000) for p in percentiles))
+
+
+async def run(url, users, duration, site_list, seed):
+
+    with urllib.request.urlopen(urllib.parse.urljoin(url.geturl(), '/_dash-dependencies')) as response:
+        dependencies = json.load(response)
+
+    deps = {}
+
+    for dep in dependencies:
+
+        outputs = ['.'.join(output) for output in parse_outputs(dep['output'])]
+
+        deps['dashboard' if 'bar-graph.figure' in outputs else outputs[0]] = dep
+
+    deadline = time.monotonic() + duration
+
+    await asyncio.gather(*[run_user(new_user(url, deps, random.Random(seed + i)), site_list, deadline)
+                           for i in range(users)])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Load test the app with concurrent virtual users.')
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers of the booted server')
+    parser.add_argument('--port', type=int, default=8051, help='port of the booted server')
+    parser.add_argument('--url', help='url of a running server (nothing is booted)')
+    parser.add_argument('--no-figure-cache', action='store_true', help='boot the server with the figure cache off')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random sites and dates')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    os.chdir(root)
+
+    import sites
+
+    process = None
+
+    if args.url is None:
+
+        env = dict(os.environ, WEB_CONCURRENCY=str(args.workers))
+
+        if args.no_figure_cache:
+            env['FIGURE_CACHE_SIZE_MB'] = '0'
+
+        process = start_server(args.port, args.workers, env)
+
+        url = urllib.parse.urlparse('http://127.0.0.1:{}'.format(args.port))
+
+    else:
+        url = urllib.parse.urlparse(args.url)
+
+    try:
+
+        tic = time.perf_counter()
+
+        asyncio.run(run(url, args.users, args.duration, sites.site_list, args.seed))
+
+        result = summary(time.perf_counter() - tic)
+
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    result['args'] = vars(args)
+
+    report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,62 @@
-from dash import Input, Output, callback
-import plotly.express as px
-import numpy as np
-import pandas as pd
+from dash import Input, Output, callback, ctx, no_update
+import lazyimport
+
+px = lazyimport.module('plotly.express')
+go = lazyimport.module('plotly.graph_objects')
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
 
 import layouts
 import config
 import utils
+import counterseries
+import datastore
+import gaps
+import compactfig
+import figcache
+import multisite
+import perf
+import regression
+import sites
+import weekstats
 
 from datetime import timedelta
+import traceback
 
-# Callback for the main bar chart
-@callback(
-    Output(component_id='bar-graph', component_property='figure'),
-    Input(component_id='data-dir-radio', component_property='value'),
-    Input(component_id='data-agg-radio', component_property='value'),
-    Input(component_id='my-date-picker-range', component_property='start_date'),
-    Input(component_id='my-date-picker-range', component_property='end_date'),
-    Input('intermediate-value', 'data'),
-    Input('weather-value', 'data'),
-    Input('daily-notes', 'data'),
-    Input('site-config', 'data'),
-    )
-    
-def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_weather, df_notes, site_config):
+# Resolutions of the bar chart drawn with a limited number of bars (see utils.bar_lod)
+lod_agg_radio_vals = ['15_min', '30_min', '1_hour']
+
+
+# A function to get the dates zoomed into on the bar chart from its relayoutData:
+# None for the whole range, False if the event does not change the x axis range
+def zoom_window(relayout_data):
 
-    df = pd.read_json(df, orient='split')
+    if not relayout_data:
+        return None
 
-    df_weather = pd.read_json(df_weather, orient='split')
+    if 'xaxis.range[0]' in relayout_data:
+        return [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
 
-    df_notes = pd.read_json(df_notes, orient='split')
+    if 'xaxis.range' in relayout_data:
+        return list(relayout_data['xaxis.range'])
+
+    if relayout_data.get('xaxis.autorange'):
+        return None
+
+    return False
+
+
+# Figure of the main bar chart
+def bar_figure(shared, site_config, dir_radio_val, agg_radio_val, window):
+
+    dataset = shared['dataset']
+
+    start_date, end_date = shared['start_date'], shared['end_date']
 
     bargap = 0.1
 
+    bars = None   # offsets and widths of the bars, if they were limited
+
     if agg_radio_val == '15_min':
         rule = '15T'
         bargap = 0
@@ -48,19 +73,17 @@ def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_wea
     elif agg_radio_val == '1_month':
         rule = 'M'
 
-    df_updated = utils.df_update(df=df, rule=rule, start_date=start_date, end_date=end_date)
-
-    df_weather_updated = utils.df_update(df=df_weather, rule=rule, start_date=start_date, end_date=end_date, agg='mean')
+    # slice the precomputed sums (or sum the 15-min series over the selected dates only)
+    if rule == 'D':
+        df_updated = shared['daily']
+    else:
+        df_updated = datastore.select(dataset, rule, start_date=start_date, end_date=end_date)
 
     marker_color = config.color[dir_radio_val]
 
-    # add additional hover data for *daily* chart
+    # add additional hover data for *daily* chart (the weather and notes are in the daily fact table)
     if agg_radio_val == '1_day':
 
-        df_updated = df_updated.join(df_weather)
-
-        df_updated = df_updated.join(df_notes)
-
         hover_data = ['day_of_week', 'TMIN', 'TMAX', 'PRCP', 'notes', 'in', 'out']
 
         if dir_radio_val == "both":
@@ -85,6 +108,8 @@ def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_wea
 
     elif agg_radio_val == '1_week':
 
+        df_weather_updated = utils.df_filter(dataset['weather_pyramid'][rule], start_date=start_date, end_date=end_date)
+
         df_updated = df_updated.join(df_weather_updated.drop(columns=['day_of_week']))   # join with weekly average weather data
 
         hover_data = ['day_of_week', 'TMIN', 'TMAX']
@@ -94,6 +119,8 @@ def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_wea
                         '<br>Ave daily low/high temp (F): %{customdata[1]:.0f}\u00B0 - %{customdata[2]:.0f}\u00B0'
     elif agg_radio_val == '1_month':
 
+        df_weather_updated = utils.df_filter(dataset['weather_pyramid'][rule], start_date=start_date, end_date=end_date)
+
         df_updated = df_updated.join(df_weather_updated.drop(columns=['day_of_week']))   # join with month average weather data
 
         hover_data = ['day_of_week', 'TMIN', 'TMAX']
@@ -104,6 +131,11 @@ def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_wea
 
     else:
 
+        # the peaks of the slots in buckets, at most config.bar_max_points bars in the zoomed range
+        step = dataset['series']['step'] * counterseries.rule_slots[rule]
+
+        df_updated, bars = utils.bar_lod(df_updated, dir_radio_val, step, config.bar_max_points, window)
+
         hover_data = ['day_of_week']
 
         hovertemplate = 'Date: %{x|%b %d, %Y} (%{customdata[0]})' + \
@@ -119,6 +151,9 @@ def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_wea
     fig1.update_traces(marker_color=marker_color, 
                        hovertemplate=hovertemplate) 
 
+    if bars is not None:
+        fig1.update_traces(offset=bars['offset'], width=bars['width'])
+
     fig1.update_layout(xaxis_title='', 
                        yaxis_title='Count', 
                        title='<b>Bike traffic by date & time</b>',
@@ -156,76 +191,151 @@ def update_figure(dir_radio_val, agg_radio_val, start_date, end_date, df, df_wea
 
         fig1.update_xaxes(dtick='M1', tickformat='%B\n%Y', tick0='2000-01-31')
 
+    # hide the long gaps in the data (e.g. a counter removed for the winter)
+    if agg_radio_val not in ['1_week', '1_month']:
+        fig1.update_xaxes(rangebreaks=gaps.rangebreaks(dataset['gaps'], config.rangebreak_min_days))
+
+    # keep the zoomed range when the finer bars are sent
+    if window:
+        fig1.update_xaxes(range=window)
+
     return fig1
 
-    # fig1.update_xaxes(rangebreaks=[dict(values=["2022-11-30", "2023-04-30"])])   # not working
+# Names of the directions in the summary tables
+def direction_names(site_config):
 
-# Callback for the summary table
-@callback(
-    Output(component_id='avg-table', component_property='data'),
-    Input(component_id='my-date-picker-range', component_property='start_date'),
-    Input(component_id='my-date-picker-range', component_property='end_date'),
-    Input('intermediate-value', 'data'),
-    Input('site-config', 'data'),
-    )
+    return {'bi_direction': 'Both directions',
+            'in': site_config['config_direction']['in'],
+            'out': site_config['config_direction']['out']}
 
-def update_table(start_date, end_date, df, site_config):
 
-    df = pd.read_json(df, orient='split')
+# Data of the summary table
+# (the totals over the selected dates are differences of the cumulative daily totals, see weekstats.py)
+def summary_table(shared, site_config):
 
-    df_updated = utils.df_update(df=df, 
-                           rule='D', 
-                           start_date=start_date, 
-                           end_date=end_date)
+    stats = shared['dataset']['week_stats']
 
-    df_updated.drop(columns='day_of_week', inplace=True)
+    start_date, end_date = shared['start_date'], shared['end_date']
 
-    total_vol = df_updated.sum()
-    daily_avg = df_updated.mean()
+    # days of the selected dates outside the gaps in the data
+    days = gaps.days_with_data(shared['dataset']['gaps'], start_date, end_date)
 
-    # Calculate percentages
-    perc_in = total_vol.loc['in'] / total_vol.loc['bi_direction']
-    perc_out = total_vol.loc['out'] / total_vol.loc['bi_direction']
+    totals = {col: weekstats.total(stats, col, start_date, end_date) for col in counterseries.columns}
 
-    perc = pd.Series({'in': perc_in, 
-                      'out': perc_out, 
-                      'bi_direction': 1})
+    data_table = []
 
-    direction = pd.Series({'in': site_config['config_direction']['in'], 
-                           'out': site_config['config_direction']['out'], 
-                           'bi_direction': 'Both directions'})
+    for col, name in direction_names(site_config).items():
 
-    table = pd.DataFrame((direction, total_vol, daily_avg, perc)).T
+        total_vol, days_counted = totals[col]
 
-    table.columns = ['dir', 'total_vol', 'daily_avg', 'perc']
+        with np.errstate(invalid='ignore', divide='ignore'):   # NaN without data
+            daily_avg = total_vol / days_counted
+            perc = 1 if col == 'bi_direction' else total_vol / totals['bi_direction'][0]
 
-    data_table = table.loc[['bi_direction', 'in', 'out']].to_dict('records')
-    
-    return  data_table
+        data_table.append(dict(dir=name, total_vol=total_vol, daily_avg=daily_avg, perc=perc, days=days))
 
+    return data_table
 
-# Callback for the time of day chart (showing raw data)
-@callback(
-    Output(component_id='time-of-day', component_property='figure'),
-    Input(component_id='data-dir-radio', component_property='value'),
-    Input(component_id='time-day-checklist', component_property='value'),
-    Input(component_id='my-date-picker-range', component_property='start_date'),
-    Input(component_id='my-date-picker-range', component_property='end_date'),
-    Input('intermediate-value', 'data'),
-    )
 
-def update_figure(dir_radio_val, day_checklist_val, start_date, end_date, df):
+# Data of the table of the busiest day and hour and of the weekday and weekend averages
+def peak_table(shared, site_config):
 
-    df = pd.read_json(df, orient='split')
-    
-    df_time = utils.df_update(df=df, rule='1H', start_date=start_date, end_date=end_date)
+    stats = shared['dataset']['week_stats']
+
+    start_date, end_date = shared['start_date'], shared['end_date']
+
+    data_table = []
+
+    for col, name in direction_names(site_config).items():
+
+        weekday_avg, weekend_avg = weekstats.weekday_weekend_means(stats, col, start_date, end_date)
+
+        peak_day = weekstats.peak_day(stats, col, start_date, end_date)
+        peak_hour = weekstats.peak_hour(stats, col, start_date, end_date)
+
+        data_table.append(dict(dir=name,
+                               weekday_avg=weekday_avg,
+                               weekend_avg=weekend_avg,
+                               peak_day='' if peak_day is None else '{:%a %b %d, %Y} ({:,.0f})'.format(*peak_day),
+                               peak_hour='' if peak_hour is None else '{:%a %b %d, %Y %I:%M %p} ({:,.0f})'.format(*peak_hour)))
+
+    return data_table
+
+
+# An empty figure with the title of a chart, for a selection without any data
+def empty_figure(title):
+
+    fig = go.Figure()
+
+    fig.update_layout(title=title,
+                      title_x=0.5,  # center title
+                      font=config.figure_font,
+                      height=500,
+                      template=config.template,
+                      modebar_remove=config.modebar_remove,
+                      margin=dict(l=0, r=0, t=40, b=0),
+                      xaxis_visible=False,
+                      yaxis_visible=False,
+                      annotations=[dict(text='No data for the selected days', showarrow=False,
+                                        xref='paper', yref='paper', x=0.5, y=0.5)])
+
+    return fig
+
+
+# A box plot trace from precomputed statistics (see weekstats.box_stats),
+# leaving out the positions without data
+def box_trace(x, box):
+
+    has_data = box['count'] > 0
+
+    return go.Box(x=np.asarray(x)[has_data],
+                  q1=box['q1'][has_data],
+                  median=box['median'][has_data],
+                  q3=box['q3'][has_data],
+                  lowerfence=box['lowerfence'][has_data],
+                  upperfence=box['upperfence'][has_data],
+                  boxpoints=False)
+
+
+# A function to keep the points drawn over a box plot computed on the server:
+# the outliers and a sample of the other points (at most config.strip_max_points)
+def strip_points(df, values, positions, box):
+
+    outside = (values < box['lowerfence'][positions]) | (values > box['upperfence'][positions])
+
+    return df.iloc[utils.sample_rows(outside, config.strip_max_points)]
+
+
+# Figure of the time of day chart (showing raw data)
+def time_of_day_figure(shared, site_config, dir_radio_val, day_checklist_val):
+
+    df_time = shared['hourly']
 
     df_time = df_time[df_time['day_of_week'].isin(day_checklist_val)]
 
-    fig2 = px.box(data_frame=df_time,
-                  x=df_time.index.hour, 
-                  y=df_time[dir_radio_val],
-                  points=False)
+    if df_time.empty:
+        return empty_figure('<b>Hourly traffic by time of day</b>')
+
+    y_max = df_time[dir_radio_val].max()
+
+    if config.box_stats_on_server:
+
+        # quartiles of all the hours at once from the hourly matrix of the selected days
+        matrix, _ = weekstats.rows(shared['dataset']['week_stats'], dir_radio_val,
+                                   shared['start_date'], shared['end_date'], day_checklist_val)
+
+        box = weekstats.box_stats(matrix[:, :weekstats.hours])
+
+        fig2 = go.Figure(box_trace(np.arange(weekstats.hours), box))
+
+        df_time = strip_points(df_time, df_time[dir_radio_val].to_numpy(), df_time.index.hour, box)
+
+    else:
+
+        fig2 = px.box(data_frame=df_time,
+                      x=df_time.index.hour, 
+                      y=df_time[dir_radio_val],
+                      points=False)
 
     xticks=np.arange(-0.5, 25, 1) 
     # xlabels=np.arange(0, 25, 1)
@@ -262,7 +372,7 @@ def update_figure(dir_radio_val, day_checklist_val, start_date, end_date, df):
                        title_x=0.5,  # center title
                        transition_duration=500,
                        font=config.figure_font,
-                       yaxis_range=[0, df_time[dir_radio_val].max()+5], 
+                       yaxis_range=[0, y_max+5], 
                        height=500,
                        template=config.template,
                        modebar_remove=config.modebar_remove,
@@ -273,49 +383,51 @@ def update_figure(dir_radio_val, day_checklist_val, start_date, end_date, df):
     return fig2
 
 
-# Callback for the day of week chart
-@callback(
-    Output(component_id='day-of-week', component_property='figure'),
-    Input(component_id='data-dir-radio', component_property='value'),
-    Input(component_id='my-date-picker-range', component_property='start_date'),
-    Input(component_id='my-date-picker-range', component_property='end_date'),
-    Input('intermediate-value', 'data'),
-    Input('weather-value', 'data'),
-    )
-
-def update_figure(dir_radio_val, start_date, end_date, df, df_weather):
-
-    df = pd.read_json(df, orient='split')
+# Figure of the day of week chart
+def day_of_week_figure(shared, site_config, dir_radio_val):
 
-    df_weather = pd.read_json(df_weather, orient='split')
-    
-    df_day = utils.df_update(df=df, rule='1D', start_date=start_date, end_date=end_date)
+    df_day = shared['daily']
 
-    df_day = df_day.join(df_weather)
+    if df_day.empty:
+        return empty_figure('<b>Daily traffic by day of week</b>')
 
     category_orders = config.weekday_list
 
-    hover_data = [df_day.index.date, 'TMIN', 'TMAX', 'PRCP']
-
     # To format date/time: https://github.com/d3/d3-time-format
     hovertemplate = 'Date: %{customdata[0]|%b %d, %Y} (%{x})' + \
                     '<br>Count: %{y}' + \
                     '<br>Temperature (F): %{customdata[1]}\u00B0 - %{customdata[2]}\u00B0' + \
                     '<br>Precipitation: %{customdata[3]} inches'
 
-    fig3 = px.box(data_frame=df_day,
-                  x=df_day.day_of_week,
-                  y=df_day[dir_radio_val], 
-                  category_orders=category_orders,
-                #   labels=labels,
-                #   hover_data=hover_data, 
-                #   template=config.template, 
-                #   points='all',
-                  points=False,
-                  )
+    y_max = df_day[dir_radio_val].max()
+
+    if config.box_stats_on_server:
+
+        # quartiles of the 7 days of week at once from the daily totals arranged by week
+        box = weekstats.box_stats(weekstats.daily_by_weekday(shared['dataset']['week_stats'], dir_radio_val,
+                                                             shared['start_date'], shared['end_date']))
+
+        fig3 = go.Figure(box_trace(category_orders, box))
+
+        df_day = strip_points(df_day, df_day[dir_radio_val].to_numpy(), df_day.index.dayofweek, box)
+
+    else:
+
+        fig3 = px.box(data_frame=df_day,
+                      x=df_day.day_of_week,
+                      y=df_day[dir_radio_val], 
+                      category_orders=category_orders,
+                    #   labels=labels,
+                    #   hover_data=hover_data, 
+                    #   template=config.template, 
+                    #   points='all',
+                      points=False,
+                      )
 
     marker_color = utils.rgb2rgba(config.color[dir_radio_val], alpha=0.7)
 
+    hover_data = [df_day.index.date, 'TMIN', 'TMAX', 'PRCP']
+
     fig3.add_trace(px.strip(df_day, 
                             x=df_day.day_of_week,
                             y=df_day[dir_radio_val], 
@@ -332,7 +444,7 @@ def update_figure(dir_radio_val, start_date, end_date, df, df_weather):
                        yaxis_title='Count',
                        title='<b>Daily traffic by day of week</b>',
                        title_x=0.5,  # center title
-                       yaxis_range=[0, df_day[dir_radio_val].max()+20], 
+                       yaxis_range=[0, y_max+20], 
                        transition_duration=500,
                        font=config.figure_font,
                        height=500,
@@ -346,30 +458,18 @@ def update_figure(dir_radio_val, start_date, end_date, df, df_weather):
     return fig3
 
 
-# Callback for the average traffic by time of day line chart
-@callback(
-    Output(component_id='avg-hour-traffic', component_property='figure'),
-    Input(component_id='data-dir-radio', component_property='value'),
-    Input(component_id='my-date-picker-range', component_property='start_date'),
-    Input(component_id='my-date-picker-range', component_property='end_date'),
-    Input('intermediate-value', 'data'),
-    )
-    
-def update_figure(dir_radio_val, start_date, end_date, df):
-
-    df = pd.read_json(df, orient='split')
-    
-    df_updated = utils.df_update(df=df, rule='H', start_date=start_date, end_date=end_date)
+# Figure of the average traffic by time of day line chart
+def avg_hour_figure(shared, site_config, dir_radio_val):
 
     days = config.weekday_list
 
-    ctb_time = pd.crosstab(index = df_updated.day_of_week, 
-                           columns = df_updated.index.hour,
-                           rownames=['day_of_week'],
-                           values = df_updated[dir_radio_val], 
-                           aggfunc = 'mean').reindex(days)
+    # mean hourly counts by day of week from the running aggregates (hours without data are dropped)
+    ctb_time = pd.DataFrame(weekstats.mean(shared['dataset']['week_stats'], dir_radio_val,
+                                           shared['start_date'], shared['end_date'])[:, :weekstats.hours],
+                            index=pd.Index(days, name='day_of_week'),
+                            columns=pd.Index(range(weekstats.hours), name='hour')).dropna(axis=1, how='all')
 
-    labels = {'col_0': 'Time of day', 
+    labels = {'hour': 'Time of day', 
               'day_of_week': 'Day of week', 
               'value': 'Average hourly count'}
 
@@ -446,34 +546,13 @@ def update_figure(dir_radio_val, start_date, end_date, df):
     return fig4
 
 
-# Callback for the temperature vs count scatter chart
-@callback(
-    Output(component_id='weather-plot', component_property='figure'),
-    Input(component_id='data-dir-radio', component_property='value'),
-    Input(component_id='day-checklist', component_property='value'),
-    Input(component_id='rain-radio', component_property='value'),
-    Input(component_id='my-date-picker-range', component_property='start_date'),
-    Input(component_id='my-date-picker-range', component_property='end_date'),
-    Input('intermediate-value', 'data'),
-    Input('weather-value', 'data'),
-    )
-
-def update_figure(dir_radio_val, day_checklist_val, rain_radio_val, start_date, end_date, df, df_temp):
-
-    df = pd.read_json(df, orient='split')
-
-    df_temp = pd.read_json(df_temp, orient='split')
-
-    df_updated = utils.df_update(df=df, rule='D', start_date=start_date, end_date=end_date)
+# Figure of the temperature vs count scatter chart
+def weather_figure(shared, site_config, dir_radio_val, day_checklist_val, rain_radio_val):
 
-    dff_temp = df_temp[start_date : end_date]
-
-    df_weather = df_updated.join(dff_temp)
+    df_weather = shared['daily']
 
     df_weather = df_weather[df_weather['day_of_week'].isin(day_checklist_val)]
 
-    df_weather['rained'] = df_weather['PRCP'].apply(lambda x: 1 if x > 0 else 0)
-
     if rain_radio_val == 'Only days without rain':
         df_weather = df_weather.loc[df_weather['rained'] == 0]
 
@@ -489,8 +568,21 @@ def update_figure(dir_radio_val, day_checklist_val, rain_radio_val, start_date,
     fig5 = px.scatter(df_weather, 
                       x='TMAX', 
                       y=dir_radio_val,
-                      hover_data=hover_data, 
-                      trendline='ols')
+                      hover_data=hover_data)
+
+    # least squares trendline of the daily count against the daily high temperature
+    trend = regression.fit_line(df_weather['TMAX'], df_weather[dir_radio_val])
+
+    if trend['n'] >= 2:
+
+        trend_x = np.sort(df_weather['TMAX'][df_weather[['TMAX', dir_radio_val]].notna().all(axis=1)].to_numpy())
+
+        fig5.add_trace(go.Scatter(x=trend_x,
+                                  y=trend['slope'] * trend_x + trend['intercept'],
+                                  mode='lines',
+                                  name='',
+                                  legendgroup='',
+                                  showlegend=False))
 
     marker_color = utils.rgb2rgba(config.color[dir_radio_val], alpha=0.7)
     
@@ -498,6 +590,15 @@ def update_figure(dir_radio_val, day_checklist_val, rain_radio_val, start_date,
                        marker_size=20, 
                        hovertemplate=hovertemplate)
 
+    if trend['n'] >= 2:
+
+        fig5.update_traces(selector=dict(mode='lines'),
+                           hovertemplate='<b>Trendline</b> (least squares, %{meta[3]:,} days)' + \
+                                         '<br>Count = %{meta[0]:.2f} \u00D7 temperature %{meta[1]:+.1f}' + \
+                                         '<br>R\u00B2 = %{meta[2]:.3f}' + \
+                                         '<br>Temperature (F): %{x}\u00B0, trend count: %{y:.0f}<extra></extra>',
+                           meta=[trend['slope'], trend['intercept'], trend['rsquared'], int(trend['n'])])
+
     fig5.update_layout(xaxis_title='Daily high temperature (Fahrenheit)', 
                        yaxis_title='Daily count',
                        title='<b>Daily traffic by daily high temperature</b>',
@@ -512,4 +613,191 @@ def update_figure(dir_radio_val, day_checklist_val, rain_radio_val, start_date,
                        margin=dict(l=0, r=0, t=40, b=0),
                        )
                        
-    return fig5
\ No newline at end of file
+    return fig5
+
+
+# The outputs of update_dashboard: the function building each of them and the
+# ids of the controls (besides the dates and the dataset) it depends on
+dashboard_outputs = {'bar-graph': (bar_figure, ['data-dir-radio', 'data-agg-radio', 'bar-graph']),
+                     'avg-table': (summary_table, []),
+                     'peak-table': (peak_table, []),
+                     'time-of-day': (time_of_day_figure, ['data-dir-radio', 'time-day-checklist']),
+                     'day-of-week': (day_of_week_figure, ['data-dir-radio']),
+                     'avg-hour-traffic': (avg_hour_figure, ['data-dir-radio']),
+                     'weather-plot': (weather_figure, ['data-dir-radio', 'day-checklist', 'rain-radio'])}
+
+
+# A function to compute the data shared by the charts of the selected dates
+def shared_data(dataset, start_date, end_date):
+
+    return dict(dataset=dataset,
+                start_date=start_date,
+                end_date=end_date,
+                daily=datastore.select(dataset, 'D', start_date=start_date, end_date=end_date),   # with the weather and notes
+                hourly=datastore.select(dataset, 'H', start_date=start_date, end_date=end_date))
+
+
+# A single callback for all the charts and the summary table: the daily and hourly
+# data are sliced once per change, and only the outputs depending on the changed
+# control are rebuilt (or read from the figure cache). Zooming into the bar chart
+# at a sub-daily resolution only rebuilds the bar chart, with finer bars in the zoomed
+# range; the zoom is forgotten (relayoutData reset) when the dates or the resolution change.
+@callback(
+    Output(component_id='bar-graph', component_property='figure'),
+    Output(component_id='avg-table', component_property='data'),
+    Output(component_id='peak-table', component_property='data'),
+    Output(component_id='time-of-day', component_property='figure'),
+    Output(component_id='day-of-week', component_property='figure'),
+    Output(component_id='avg-hour-traffic', component_property='figure'),
+    Output(component_id='weather-plot', component_property='figure'),
+    Output(component_id='bar-graph', component_property='relayoutData'),
+    Input(component_id='data-dir-radio', component_property='value'),
+    Input(component_id='data-agg-radio', component_property='value'),
+    Input(component_id='time-day-checklist', component_property='value'),
+    Input(component_id='day-checklist', component_property='value'),
+    Input(component_id='rain-radio', component_property='value'),
+    Input(component_id='my-date-picker-range', component_property='start_date'),
+    Input(component_id='my-date-picker-range', component_property='end_date'),
+    Input('dataset-key', 'data'),
+    Input('site-config', 'data'),
+    Input(component_id='bar-graph', component_property='relayoutData'),
+    )
+@perf.instrument('update_dashboard')
+def update_dashboard(dir_radio_val, agg_radio_val, time_day_checklist_val, day_checklist_val, rain_radio_val,
+                     start_date, end_date, dataset_key, site_config, relayout_data):
+
+    window = zoom_window(relayout_data)
+
+    controls = {'data-dir-radio': dir_radio_val,
+                'data-agg-radio': agg_radio_val,
+                'time-day-checklist': time_day_checklist_val,
+                'day-checklist': day_checklist_val,
+                'rain-radio': rain_radio_val,
+                'bar-graph': window or None}
+
+    triggered = set(ctx.triggered_prop_ids.values())
+
+    # the dates, the dataset or the first call change every output
+    update_all = not triggered or not triggered <= set(controls)
+
+    reset_zoom = update_all or 'data-agg-radio' in triggered
+
+    if reset_zoom or agg_radio_val not in lod_agg_radio_vals:
+
+        if triggered == {'bar-graph'}:
+            return [no_update] * (len(dashboard_outputs) + 1)
+
+        controls['bar-graph'] = None
+
+    elif triggered == {'bar-graph'} and window is False:
+        return [no_update] * (len(dashboard_outputs) + 1)
+
+    # the figures are cached under the current version of the data (the one they are built
+    # from, even if the browser still holds the key of an older version), read from the
+    # cache metadata: the dataset is only loaded when an output is not in the figure cache
+    dataset_key = {'site': dataset_key['site'],
+                   'version': datastore.data_version(datastore.site_by_url(dataset_key['site']))}
+
+    shared = {}
+
+    outputs = []
+
+    for output_id, (build, control_ids) in dashboard_outputs.items():
+
+        if not update_all and not triggered & set(control_ids):
+
+            outputs.append(no_update)
+
+            continue
+
+        args = [controls[control_id] for control_id in control_ids]
+
+        def build_output():
+
+            if not shared:
+                with perf.stage('shared_data'):
+                    shared.update(shared_data(datastore.get(dataset_key), start_date, end_date))
+
+            with perf.stage(output_id):
+                output = build(shared, site_config, *args)
+
+            if config.compact_figures:
+                with perf.stage('compact'):
+                    output = compactfig.compact(output)
+
+            return output
+
+        # a failing chart keeps its previous figure instead of failing the other outputs
+        try:
+            outputs.append(figcache.cached(output_id, [*args, start_date, end_date, dataset_key, site_config], build_output))
+        except Exception:
+            traceback.print_exc()
+            outputs.append(no_update)
+
+    outputs.append(None if reset_zoom else no_update)
+
+    return outputs
+
+
+# Figures of the page comparing the sites: the daily counts of every site
+# (one aligned sites x days matrix, see multisite.py) and their totals
+@callback(
+    Output(component_id='compare-heatmap', component_property='figure'),
+    Output(component_id='compare-totals', component_property='figure'),
+    Input(component_id='compare-dir-radio', component_property='value'),
+    Input(component_id='compare-date-picker-range', component_property='start_date'),
+    Input(component_id='compare-date-picker-range', component_property='end_date'),
+    )
+@perf.instrument('update_comparison')
+def update_comparison(dir_radio_val, start_date, end_date):
+
+    with perf.stage('daily_matrix'):
+        matrix = multisite.daily_matrix(sites.site_list, start_date, end_date, dir_radio_val)
+
+    # with the name of the direction at each site
+    titles = [site['site_title'] + ('' if dir_radio_val == 'bi_direction' else ' ({})'.format(site['config_direction'][dir_radio_val]))
+              for site in sites.site_list]
+
+    height = 150 + 30 * len(titles)
+
+    fig_heatmap = go.Figure(go.Heatmap(z=matrix.to_numpy(),
+                                       x=matrix.columns,
+                                       y=titles,
+                                       colorscale=[[0, 'white'], [1, config.color[dir_radio_val]]],
+                                       hovertemplate='%{y}' + \
+                                                     '<br>Date: %{x|%b %d, %Y}' + \
+                                                     '<br>Count: %{z:,}<extra></extra>'))
+
+    fig_heatmap.update_layout(title='<b>Daily traffic by counter</b>',
+                              title_x=0.5,  # center title
+                              font=config.figure_font,
+                              height=height,
+                              template=config.template,
+                              modebar_remove=config.modebar_remove,
+                              margin=dict(l=0, r=0, t=40, b=0),
+                              yaxis_autorange='reversed',   # same order as the list of sites
+                              )
+
+    fig_totals = go.Figure(go.Bar(x=matrix.sum(axis=1, min_count=1).to_numpy(),
+                                  y=titles,
+                                  orientation='h',
+                                  customdata=matrix.notna().sum(axis=1).to_numpy(),
+                                  marker_color=config.color[dir_radio_val],
+                                  hovertemplate='%{y}' + \
+                                                '<br>Total traffic: %{x:,}' + \
+                                                '<br>Days with data: %{customdata}<extra></extra>'))
+
+    fig_totals.update_layout(title='<b>Total traffic on the selected dates</b>',
+                             title_x=0.5,  # center title
+                             font=config.figure_font,
+                             height=height,
+                             template=config.template,
+                             modebar_remove=config.modebar_remove,
+                             margin=dict(l=0, r=0, t=40, b=0),
+                             yaxis_autorange='reversed',
+                             )
+
+    if config.compact_figures:
+        return compactfig.compact(fig_heatmap), compactfig.compact(fig_totals)
+
+    return fig_heatmap, fig_totals
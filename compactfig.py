@@ -0,0 +1,206 @@
+# Compact JSON payloads of the figures sent to the browser
+#
+# With config.compact_figures on, the figures built by the callbacks are
+# rewritten before they are sent (and cached):
+#
+#   - a time axis with a regular step (the bars of a day, hour or 15 min
+#     resolution) is sent as a start and a step (x0 and dx in ms) instead of
+#     one timestamp string per point; other times are sent as short strings
+#     ('2023-05-01 17:15' instead of '2023-05-01T17:15:00.000000000'), which
+#     also compress better than numbers
+#   - the day of week hover field repeated for every point (customdata) is
+#     read from the time of the point instead (%{x|%a} in the hovertemplate)
+#   - the numeric arrays are sent as typed arrays: {'dtype', 'bdata'}, the
+#     little-endian bytes of the values in base64, integers in the smallest
+#     type holding them, instead of lists of decimal numbers
+#
+# Typed arrays need plotly.js 2.28 or later (dash 2.15): with an older dash
+# the arrays stay lists of numbers (typed_arrays below).
+#
+# `python benchmarks/bench_payload.py` measures the size of every chart
+# before and after, and checks that the compact figures hold the same data.
+
+import base64
+import datetime
+import re
+
+import dash
+
+import lazyimport
+
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
+
+import config
+
+typed_arrays = tuple(int(part) for part in re.findall(r'\d+', dash.__version__)[:2]) >= (2, 15)
+
+min_length = 16   # shorter arrays are left as they are
+
+regular_step_types = ['bar', 'scatter', 'heatmap']   # trace types with x0 and dx
+
+int_dtypes = ['u1', 'i1', 'u2', 'i2', 'u4', 'i4']   # typed array types of the integers, smallest first
+
+# Attributes of a trace that are never rewritten as typed arrays (text, or read by index in a hovertemplate)
+text_keys = ['customdata', 'text', 'hovertext', 'ids']
+
+
+# A function to get a trace attribute as a numpy array (decoding a typed array)
+def _array(value):
+
+    if isinstance(value, dict) and 'bdata' in value:
+
+        array = np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']).newbyteorder('<'))
+
+        if 'shape' in value:
+            array = array.reshape([int(n) for n in str(value['shape']).split(',')])
+
+        return array
+
+    return np.asarray(value)
+
+
+# A function to get the times of an array of dates (None if it does not hold dates)
+def _times(array):
+
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype('datetime64[ns]')
+
+    if array.dtype == object and len(array) and isinstance(array[0], (datetime.date, pd.Timestamp)):
+        return pd.DatetimeIndex(array).to_numpy()
+
+    return None
+
+
+# A function to encode a numeric array as a typed array (None if it is not numeric)
+def _typed(array):
+
+    if array.dtype.kind not in 'iuf' or array.ndim > 2:
+        return None
+
+    dtype = 'f8'
+
+    integral = array.dtype.kind in 'iu' or np.isfinite(array).all() and (array == np.round(array)).all()
+
+    if integral and array.size:
+
+        low, high = array.min(), array.max()
+
+        for int_dtype in int_dtypes:
+            if np.iinfo(int_dtype).min <= low and high <= np.iinfo(int_dtype).max:
+                dtype = int_dtype
+                break
+
+    spec = dict(dtype=dtype, bdata=base64.b64encode(array.astype('<' + dtype).tobytes()).decode())
+
+    if array.ndim == 2:
+        spec['shape'] = '{},{}'.format(*array.shape)
+
+    return spec
+
+
+# A function to drop the day of week columns of the customdata of a trace (the day of
+# week of its time) and read the day of week from the time in its hovertemplate instead
+def _dedupe_day_of_week(trace, times):
+
+    customdata = np.asarray(trace['customdata'], dtype=object)
+
+    if customdata.ndim != 2 or len(customdata) != len(times):
+        return
+
+    day_names = np.array(config.weekday_list, dtype=object)[pd.DatetimeIndex(times).dayofweek]
+
+    drop = [i for i in range(customdata.shape[1]) if (customdata[:, i] == day_names).all()]
+
+    if not drop:
+        return
+
+    keep = [i for i in range(customdata.shape[1]) if i not in drop]
+
+    # renumber the other placeholders, keeping their format (':.2f', '|%b %d', ...)
+    def replace(match):
+        i = int(match.group(1))
+        return '%{x|%a}' if i in drop else '%{{customdata[{}]{}}}'.format(keep.index(i), match.group(2))
+
+    trace['hovertemplate'] = re.sub(r'%\{customdata\[(\d+)\]([^}]*)\}', replace, trace.get('hovertemplate', ''))
+
+    if keep:
+        trace['customdata'] = customdata[:, keep]
+    else:
+        del trace['customdata']
+
+
+# A function to rewrite the times of a trace: a start and a step if the step is regular, else short strings
+def _compact_times(trace, layout, times):
+
+    axis = 'xaxis' + trace.get('xaxis', 'x')[1:]
+
+    layout.setdefault(axis, {})['type'] = 'date'
+
+    ms = np.timedelta64(1, 'ms')
+
+    steps = np.diff(times)
+
+    if len(times) > 1 and trace.get('type') in regular_step_types and (steps == steps[0]).all():
+
+        del trace['x']
+
+        trace['x0'] = str(pd.Timestamp(times[0]))
+        trace['dx'] = steps[0] / ms
+
+    else:
+        index = pd.DatetimeIndex(times)
+        trace['x'] = index.strftime('%Y-%m-%d' if (index == index.normalize()).all() else '%Y-%m-%d %H:%M').tolist()
+
+
+# A function to rewrite the numeric arrays of a trace (and of its nested attributes) as typed arrays
+def _compact_arrays(obj):
+
+    for key, value in obj.items():
+
+        if key in text_keys:
+            continue
+
+        if isinstance(value, dict) and 'bdata' not in value:
+            _compact_arrays(value)   # nested attributes (marker, line, ...)
+
+        elif isinstance(value, (list, tuple, np.ndarray, dict)):
+
+            array = _array(value)
+
+            if array.size >= min_length:
+
+                spec = _typed(array)
+
+                if spec is not None:
+                    obj[key] = spec
+
+
+# A function to get the compact version of a figure, as a figure dict
+# (anything else, like the data of a table, is returned as it is)
+def compact(figure):
+
+    if not hasattr(figure, 'to_plotly_json'):
+        return figure
+
+    figure = figure.to_plotly_json()
+
+    layout = figure.setdefault('layout', {})
+
+    for trace in figure['data']:
+
+        times = _times(_array(trace['x'])) if isinstance(trace.get('x'), (list, tuple, np.ndarray)) else None
+
+        if times is None or len(times) < min_length:
+            continue
+
+        if 'customdata' in trace:
+            _dedupe_day_of_week(trace, times)
+
+        _compact_times(trace, layout, times)
+
+    if typed_arrays:
+        for trace in figure['data']:
+            _compact_arrays(trace)
+
+    return figure
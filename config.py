@@ -38,3 +38,29 @@ time_of_day_labels = ['12 AM', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10'
 modebar_remove = ['zoom', 'pan', 'select','lasso2d', 'zoomIn', 'zoomOut', 'autoScale']
 
 
+# Most bars drawn by the bar chart at a sub-daily resolution in the zoomed (or whole)
+# date range; the bars beyond it are limited to a quarter of that on each side
+bar_max_points = 2000
+
+
+# Compute the quartiles and whiskers of the box plots on the server (True) or let
+# the browser compute them from all the points (False)
+box_stats_on_server = True
+
+# Most points drawn over a box plot computed on the server: the outliers and a
+# random sample of the other points (None draws all of them)
+strip_max_points = 1000
+
+
+# Runs of at least this many days counting nothing in both directions are gaps in
+# the data (the counter was off), like the days without data (see gaps.py)
+gap_min_zero_days = 3
+
+# Gaps of at least this many days are hidden from the x axis of the bar chart
+# at the daily and sub-daily resolutions
+rangebreak_min_days = 30
+
+
+# Send the figures with their times as a start and a step, the day of week hover
+# field read from the times and the numeric arrays as typed arrays (see compactfig.py)
+compact_figures = True
@@ -0,0 +1,143 @@
+# A compact in-memory container for the 15-min counter data of a site
+#
+# The counter data is regular (one slot every 15 minutes from midnight of
+# the first day of the date range), so instead of a dataframe with a
+# DatetimeIndex and float64 columns, a series is a dict holding:
+#
+#   start    the time of the first slot (pd.Timestamp)
+#   step     the time between slots (pd.Timedelta)
+#   slots    the number of slots
+#   counts   {'in': array, 'out': array} of small unsigned ints
+#   missing  {'in': bits, 'out': bits} of the slots without data, packed 8 per byte
+#
+# 'bi_direction' is not stored but computed when asked for, and pandas objects
+# are only built for the date range that is plotted. The arrays loaded from the
+# cache are read-only memory maps of the cache files (see datacache.py), shared
+# by all the processes using them.
+
+import lazyimport
+
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
+
+import datacache
+
+columns = ['in', 'out', 'bi_direction']
+
+slots_per_day = 96   # 15-min slots
+
+# Number of 15-min slots in each sub-daily resample rule
+rule_slots = {'15T': 1, '30T': 2, 'H': 4, 'D': slots_per_day}
+
+
+# A function to load the series of a counter export over a date range from the cache
+def from_cache(data_file_name, date_range):
+
+    meta, counts, missing = datacache.load_arrays(data_file_name, date_range)
+
+    return dict(start=pd.Timestamp(meta['start']),
+                step=pd.Timedelta(seconds=meta['step_seconds']),
+                slots=meta['slots'],
+                counts=counts,
+                missing=missing)
+
+
+# A function to get the missing slots of a column as a boolean array
+def missing(series, col):
+
+    if col == 'bi_direction':
+        return missing(series, 'in') | missing(series, 'out')
+
+    return np.unpackbits(series['missing'][col], count=series['slots']).astype(bool)
+
+
+# A function to mark the slots between pairs of dates (both included) as missing:
+# the bits of each column are unpacked and packed again once for all the pairs
+def mask_dates(series, date_pairs):
+
+    ranges = []
+
+    for start_date, end_date in date_pairs:
+
+        first = max(0, (pd.Timestamp(start_date) - series['start']) // series['step'])
+        stop = min(series['slots'], (pd.Timestamp(end_date) + pd.Timedelta(days=1) - series['start']) // series['step'])
+
+        if first < stop:
+            ranges.append((first, stop))
+
+    if not ranges:
+        return series
+
+    for col in series['counts']:
+
+        bits = missing(series, col)
+
+        for first, stop in ranges:
+            bits[first:stop] = True
+
+        series['missing'][col] = np.packbits(bits)   # a new array, the memory map is read-only
+
+    return series
+
+
+# A function to get the values of a column (NaN for the missing slots) in the slots first:stop
+def values(series, col, first=0, stop=None):
+
+    if col == 'bi_direction':
+        return values(series, 'in', first, stop) + values(series, 'out', first, stop)
+
+    result = series['counts'][col][first:stop].astype(np.float64)
+
+    result[missing(series, col)[first:stop]] = np.nan
+
+    return result
+
+
+# A function to sum the values in bins of a number of slots;
+# a bin without any value is NaN (like resample().sum(min_count=1))
+def bin_sum(values, slots_per_bin):
+
+    binned = values.reshape(-1, slots_per_bin)
+
+    valid = ~np.isnan(binned)
+
+    return np.where(valid.any(axis=1), np.where(valid, binned, 0).sum(axis=1), np.nan)
+
+
+# A function to get the slots of a date range (both dates included)
+def date_slots(series, start_date, end_date):
+
+    first = (pd.Timestamp(start_date) - series['start']) // series['step']
+    stop = (pd.Timestamp(end_date) + pd.Timedelta(days=1) - series['start']) // series['step']
+
+    first = min(max(first, 0), series['slots'])
+    stop = min(max(stop, first), series['slots'])
+
+    return first, stop
+
+
+# A function to build the dataframe of the sums of a sub-daily resample rule ('15T', '30T', 'H' or 'D')
+# over a date range, with the 'in', 'out' and 'bi_direction' columns
+def to_frame(series, rule='15T', start_date=None, end_date=None):
+
+    if start_date is None:
+        first, stop = 0, series['slots']
+    else:
+        first, stop = date_slots(series, start_date, end_date)
+
+    n = rule_slots[rule]
+
+    data = {col: bin_sum(values(series, col, first, stop), n) for col in columns}
+
+    index = pd.date_range(series['start'] + first * series['step'],
+                          periods=(stop - first) // n,
+                          freq=series['step'] * n,
+                          name='time')
+
+    return pd.DataFrame(data, index=index)
+
+
+# A function to get the memory used by a series, in bytes
+def nbytes(series):
+
+    return sum(a.nbytes for a in series['counts'].values()) + sum(a.nbytes for a in series['missing'].values())
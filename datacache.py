@@ -0,0 +1,609 @@
+# On-disk columnar cache of the bike counter exports
+#
+# Parsing the counter workbooks with openpyxl takes seconds, so each export
+# is converted once into a folder of NumPy arrays that later loads read back
+# in milliseconds. The cache is rebuilt only when the source file's mtime
+# changes *and* its content hash no longer matches.
+#
+# The exports are read in chunks of rows (openpyxl read-only mode for xlsx
+# files) and each row is written straight into preallocated arrays holding
+# one slot per 15 minutes of the site's date range, so the memory used does
+# not depend on the size of the file. A slot with no (or only empty) rows
+# is marked as missing.
+#
+# The arrays are loaded as read-only memory maps: the processes reading the
+# same cache folder share its pages instead of each holding a copy.
+#
+# Pre-warm the cache of every site at deploy time with:
+#
+#     python datacache.py [-j processes] [site_url ...]
+#
+# which updates the exports in parallel and exits with an error status if
+# any of them failed.
+
+import datetime
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import lazyimport
+
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
+
+counter_dir = './data/counter/'
+cache_dir = './data/cache/'
+
+cache_format = 5   # bump to invalidate every existing cache folder
+
+count_columns = ['in', 'out']
+
+step = datetime.timedelta(minutes=15)   # time step of the counter data
+
+chunk_rows = 20_000   # number of rows parsed at a time
+
+chunk_bytes = 1 << 20   # size of the csv blocks parsed at a time
+
+header_rows = 4   # rows above the data in the xlsx exports (the csv exports have 1)
+
+
+# A function to get the path of a counter export
+def source_path(data_file_name):
+
+    return counter_dir + data_file_name
+
+
+# A function to get the cache folder of a counter export over a date range
+def cache_path(data_file_name, date_range):
+
+    return os.path.join(cache_dir, '{}_{}_{}'.format(data_file_name.replace('.', '_'), *date_range))
+
+
+# A function to compute the sha256 hash of a file (or of its first `size` bytes)
+def file_hash(path, size=None):
+
+    sha = hashlib.sha256()
+
+    remaining = os.path.getsize(path) if size is None else size
+
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(1 << 20, remaining))
+            if not block:
+                break
+            sha.update(block)
+            remaining -= len(block)
+
+    return sha.hexdigest()
+
+
+# A function to get the first and the last (excluded) time slot of a date range
+def grid_bounds(date_range):
+
+    return pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+
+
+# The readers below yield the columns of a chunk of rows and, for each row, the
+# position to resume reading from after it (a row number in xlsx files, a byte
+# offset in csv files)
+
+def _xlsx_chunks(path, resume, resume_time):
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+    try:
+
+        sheet = workbook.worksheets[0]
+
+        sheet.reset_dimensions()   # some exports declare a wrong sheet size (A1:A1)
+
+        position = resume
+
+        # read the last ingested row again to check that it did not change
+        if resume_time is not None:
+            position -= 1
+
+        rows, ends = [], []
+
+        for row in sheet.iter_rows(min_row=header_rows + 1 + position, max_col=3, values_only=True):
+
+            position += 1
+
+            if resume_time is not None:
+                if row[0] is None or pd.Timestamp(row[0]) != pd.Timestamp(resume_time):
+                    raise ValueError('{} changed before row {}'.format(path, resume))
+                resume_time = None
+                continue
+
+            if row[0] is None:
+                continue
+
+            rows.append(row)
+            ends.append(position)
+
+            if len(rows) == chunk_rows:
+                yield list(zip(*rows)), ends
+                rows, ends = [], []
+
+        if rows:
+            yield list(zip(*rows)), ends
+
+    finally:
+        workbook.close()
+
+
+def _csv_chunks(path, resume):
+
+    with open(path, 'rb') as f:
+
+        if resume == 0:
+            f.readline()   # header
+        else:
+            f.seek(resume)
+
+        offset = f.tell()
+
+        while True:
+
+            lines = f.readlines(chunk_bytes)
+
+            # a last line without a newline is being written: it is read again once complete
+            partial = bool(lines) and not lines[-1].endswith(b'\n')
+
+            if partial:
+                lines.pop()
+
+            if not lines:
+                break
+
+            ends = offset + np.cumsum([len(line) for line in lines])
+
+            offset = int(ends[-1])
+
+            keep = [i for i, line in enumerate(lines) if line.strip()]
+
+            if keep:
+
+                chunk = pd.read_csv(io.BytesIO(b''.join(lines[i] for i in keep)), names=['time', 'in', 'out'], header=None)
+
+                yield (chunk['time'], chunk['in'], chunk['out']), ends[keep]
+
+            if partial:
+                break
+
+
+# A function to read a counter export (xlsx or csv) in chunks of rows, from a resume position.
+# Yields the times (as a DatetimeIndex), a float array of counts per column and the
+# resume position after each row.
+def read_chunks(data_file_name, resume=0, resume_time=None):
+
+    path = source_path(data_file_name)
+
+    if data_file_name.endswith('.csv'):
+        chunks = _csv_chunks(path, resume)
+    else:
+        chunks = _xlsx_chunks(path, resume, resume_time)
+
+    for (times, *counts), ends in chunks:
+
+        yield (pd.DatetimeIndex(pd.to_datetime(list(times))),
+               [np.array(c, dtype=np.float64) for c in counts],
+               np.asarray(ends, dtype=np.int64))
+
+
+# A function to write the rows of a counter export into the 15-min slots of the date range
+# (count arrays and masks of the slots with a count), starting from a resume position.
+# Reading stops at the first row after the date range, so that the rows after it are
+# read again once the date range is extended.
+def ingest(data_file_name, date_range, sums, valid, resume=0, resume_time=None):
+
+    start = grid_bounds(date_range)[0]
+
+    n_slots = len(sums[count_columns[0]])
+
+    rows = 0
+
+    first_slot = n_slots   # first slot written to
+
+    for times, counts, ends in read_chunks(data_file_name, resume, resume_time):
+
+        slots = (times.values.astype('datetime64[ns]').view(np.int64) - start.value) // pd.Timedelta(step).value
+
+        beyond = np.flatnonzero(slots >= n_slots)
+
+        n = int(beyond[0]) if len(beyond) else len(slots)
+
+        for col, values in zip(count_columns, counts):
+
+            keep = (slots[:n] >= 0) & ~np.isnan(values[:n])
+
+            np.add.at(sums[col], slots[:n][keep], values[:n][keep].astype(np.uint32))
+
+            valid[col][slots[:n][keep]] = True
+
+            if keep.any():
+                first_slot = min(first_slot, slots[:n][keep].min())
+
+        if n > 0:
+            rows += n
+            resume = int(ends[n - 1])
+            resume_time = str(times[n - 1])
+
+        if len(beyond):
+            break
+
+    return dict(rows=rows, resume=resume, resume_time=resume_time, first_slot=int(first_slot))
+
+
+# A function to pick the smallest unsigned int type holding all the counts
+def count_dtype(values):
+
+    high = values.max() if len(values) else 0
+
+    for dtype in (np.uint16, np.uint32):
+        if high <= np.iinfo(dtype).max:
+            return dtype
+
+    return np.uint64
+
+
+# A function to read the metadata of a cache folder (None if there is none)
+def read_meta(data_file_name, date_range):
+
+    try:
+        with open(os.path.join(cache_path(data_file_name, date_range), 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('format') != cache_format:
+        return None
+
+    return meta
+
+
+# A function to find the cache of a counter export over the longest shorter date range with
+# the same start (the date range of the site was extended), to append the new days to it
+def previous_meta(data_file_name, date_range):
+
+    prefix = os.path.basename(cache_path(data_file_name, [date_range[0], '']))
+
+    try:
+        names = os.listdir(cache_dir)
+    except FileNotFoundError:
+        return None
+
+    ends = sorted(name[len(prefix):] for name in names if name.startswith(prefix) and name[len(prefix):] < date_range[1])
+
+    for end in reversed(ends):
+
+        meta = read_meta(data_file_name, [date_range[0], end])
+
+        if meta is not None:
+            return meta
+
+    return None
+
+
+def _write_meta(folder, meta):
+
+    tmp = os.path.join(folder, 'meta.json.{}.tmp'.format(os.getpid()))   # a process may build the same folder
+
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+
+def _save_array(folder, name, array):
+
+    tmp = os.path.join(folder, '{}.{}.tmp.npy'.format(name, os.getpid()))
+
+    np.save(tmp, array)
+
+    os.replace(tmp, os.path.join(folder, name + '.npy'))
+
+
+# A function to find the first and stop positions of the runs of True in a boolean array
+def _runs(mask):
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+# A function to find the runs of whole days without counts in the grid starting at
+# midnight of the start day: the days without any data ('missing') and the days
+# counting nothing in both directions ('zero'). Returns [first day, last day] pairs.
+def empty_days(sums, valid, start):
+
+    day_slots = datetime.timedelta(days=1) // step
+
+    days = len(sums[count_columns[0]]) // day_slots
+
+    has_data = np.zeros(days, dtype=bool)
+    total = np.zeros(days)
+
+    for col in count_columns:
+
+        has_data |= valid[col][:days * day_slots].reshape(days, day_slots).any(axis=1)
+        total += np.where(valid[col], sums[col], 0)[:days * day_slots].reshape(days, day_slots).sum(axis=1)
+
+    def dates(mask):
+        return [[str((start + pd.Timedelta(days=first)).date()), str((start + pd.Timedelta(days=stop - 1)).date())]
+                for first, stop in _runs(mask)]
+
+    return dict(missing=dates(~has_data), zero=dates(has_data & (total == 0)))
+
+
+# A function to write the cache folder of a counter export
+def _save(data_file_name, date_range, sums, valid, stat, info, update):
+
+    path = source_path(data_file_name)
+
+    folder = cache_path(data_file_name, date_range)
+
+    os.makedirs(folder, exist_ok=True)
+
+    # meta.json is written last, so a half-written folder is never read
+    try:
+        os.remove(os.path.join(folder, 'meta.json'))
+    except FileNotFoundError:
+        pass
+
+    for col in count_columns:
+
+        _save_array(folder, col, sums[col].astype(count_dtype(sums[col])))
+        _save_array(folder, col + '_missing', np.packbits(~valid[col]))   # 1 bit per slot
+
+    meta = dict(format=cache_format,
+                source=data_file_name,
+                mtime_ns=stat.st_mtime_ns,
+                size=stat.st_size,
+                sha256=file_hash(path),
+                rows=info['rows'],
+                resume=info['resume'],
+                resume_time=info['resume_time'],
+                resume_sha256=file_hash(path, info['resume']) if data_file_name.endswith('.csv') else None,
+                start=str(grid_bounds(date_range)[0]),
+                end=date_range[1],
+                step_seconds=int(step.total_seconds()),
+                slots=len(sums[count_columns[0]]),
+                empty_days=empty_days(sums, valid, grid_bounds(date_range)[0]),   # for the gap index, see gaps.py
+                update=update)   # what the last (re)build did
+
+    _write_meta(folder, meta)
+
+    return meta
+
+
+def _empty_grid(date_range):
+
+    start, stop = grid_bounds(date_range)
+
+    n_slots = (stop - start) // step
+
+    sums = {col: np.zeros(n_slots, dtype=np.uint32) for col in count_columns}
+    valid = {col: np.zeros(n_slots, dtype=bool) for col in count_columns}
+
+    return sums, valid
+
+
+# A function to (re)build the cache folder of a counter export over a date range
+def build(data_file_name, date_range):
+
+    tic = time.perf_counter()
+
+    stat = os.stat(source_path(data_file_name))
+
+    sums, valid = _empty_grid(date_range)
+
+    info = ingest(data_file_name, date_range, sums, valid)
+
+    update = dict(mode='built',
+                  rows_added=info['rows'],
+                  seconds=round(time.perf_counter() - tic, 3))
+
+    return _save(data_file_name, date_range, sums, valid, stat, info, update)
+
+
+# A function to append the new rows of a counter export (or the new days of its
+# date range, from the cache of the shorter range) to its cache. Returns None when
+# the cache has to be rebuilt instead.
+def append(data_file_name, date_range, meta):
+
+    tic = time.perf_counter()
+
+    path = source_path(data_file_name)
+
+    stat = os.stat(path)
+
+    sums, valid = _empty_grid(date_range)
+
+    n_slots = len(sums[count_columns[0]])
+
+    # exports only grow, and the date range can only be extended
+    if stat.st_size < meta['size'] or n_slots < meta['slots']:
+        return None
+
+    # the rows already ingested must not have changed
+    if data_file_name.endswith('.csv') and file_hash(path, meta['resume']) != meta['resume_sha256']:
+        return None
+
+    folder = cache_path(data_file_name, [date_range[0], meta['end']])
+
+    for col in count_columns:
+
+        sums[col][:meta['slots']] = np.load(os.path.join(folder, col + '.npy'))
+        valid[col][:meta['slots']] = ~np.unpackbits(np.load(os.path.join(folder, col + '_missing.npy')), count=meta['slots']).astype(bool)
+
+    try:
+        info = ingest(data_file_name, date_range, sums, valid, meta['resume'],
+                      None if data_file_name.endswith('.csv') else meta['resume_time'])
+    except ValueError:
+        return None
+
+    first_slot = min(info['first_slot'], meta['slots'])   # the new days of the date range are new slots too
+
+    update = dict(mode='appended',
+                  rows_added=info['rows'],
+                  seconds=round(time.perf_counter() - tic, 3),
+                  previous_sha256=meta['sha256'],
+                  changed_from=str(grid_bounds(date_range)[0] + first_slot * step) if first_slot < n_slots else None)
+
+    if info['rows'] == 0:
+        info.update(resume=meta['resume'], resume_time=meta['resume_time'])
+
+    info['rows'] += meta['rows']
+
+    return _save(data_file_name, date_range, sums, valid, stat, info, update)
+
+
+# A function to check the cache of a counter export, updating it if stale
+def ensure(data_file_name, date_range):
+
+    path = source_path(data_file_name)
+
+    stat = os.stat(path)
+
+    meta = read_meta(data_file_name, date_range)
+
+    if meta is None:
+
+        meta = previous_meta(data_file_name, date_range)
+
+        if meta is None:
+            return build(data_file_name, date_range)
+
+    elif meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return meta
+
+    # the file was touched: only update if its content actually changed
+    elif meta['size'] == stat.st_size and meta['sha256'] == file_hash(path):
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_meta(cache_path(data_file_name, date_range), meta)
+        return meta
+
+    return append(data_file_name, date_range, meta) or build(data_file_name, date_range)
+
+
+# A function to load the arrays of a counter export over a date range from the cache
+# (as read-only memory maps). Returns the metadata, the count arrays and the bits of
+# the missing slots (packed 8 per byte).
+def load_arrays(data_file_name, date_range):
+
+    meta = ensure(data_file_name, date_range)
+
+    folder = cache_path(data_file_name, date_range)
+
+    counts = {col: np.load(os.path.join(folder, col + '.npy'), mmap_mode='r') for col in count_columns}
+    missing = {col: np.load(os.path.join(folder, col + '_missing.npy'), mmap_mode='r') for col in count_columns}
+
+    return meta, counts, missing
+
+
+# A function to load a counter export over a date range from the cache as a dataframe
+# with one row per 15 minutes and float 'in' and 'out' columns (NaN for gaps)
+def load_counter(data_file_name, date_range):
+
+    meta, counts, missing = load_arrays(data_file_name, date_range)
+
+    index = pd.date_range(meta['start'], periods=meta['slots'], freq=step, name='time')
+
+    data = {}
+
+    for col in count_columns:
+
+        values = counts[col].astype(np.float64)
+
+        values[np.unpackbits(missing[col], count=meta['slots']).astype(bool)] = np.nan
+
+        data[col] = values
+
+    return pd.DataFrame(data, index=index)
+
+
+# A function to bring the cache of a counter export up to date (run in the worker
+# processes of warm); returns what was done, the number of rows and the time taken
+def _warm_export(key):
+
+    data_file_name, first_day, last_day = key
+
+    date_range = [first_day, last_day]
+
+    tic = time.perf_counter()
+
+    try:
+
+        before = read_meta(data_file_name, date_range)
+
+        meta = ensure(data_file_name, date_range)
+
+    except Exception as error:   # reported with the other exports
+        return dict(error='{}: {}'.format(type(error).__name__, error), seconds=time.perf_counter() - tic)
+
+    if meta is before or (before is not None and meta['sha256'] == before['sha256'] and meta['end'] == before['end']):
+        status = 'up to date'
+    else:
+        status = '{} {:,} rows'.format(meta['update']['mode'], meta['update']['rows_added'])
+
+    return dict(status=status, rows=meta['rows'], seconds=time.perf_counter() - tic)
+
+
+# A function to ingest the new data of every site's counter export into the cache,
+# the exports in parallel over a number of processes (the number of CPUs by default).
+# Returns the number of exports that failed.
+def warm(site_list, workers=None):
+
+    keys = list(dict.fromkeys((site['data_file_name'], *site['date_range']) for site in site_list))
+
+    workers = min(workers or os.cpu_count() or 1, len(keys))
+
+    tic = time.perf_counter()
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip(keys, pool.map(_warm_export, keys)))
+    else:
+        results = {key: _warm_export(key) for key in keys}
+
+    for site in site_list:
+
+        result = results[(site['data_file_name'], *site['date_range'])]
+
+        if 'error' in result:
+            print('{} ({}): FAILED {}'.format(site['site_url'], site['data_file_name'], result['error']))
+        else:
+            print('{} ({}): {}, {:,} rows in total ({:.2f} s)'.format(
+                site['site_url'], site['data_file_name'], result['status'], result['rows'], result['seconds']))
+
+    failed = sum('error' in result for result in results.values())
+
+    print('{} counter exports of {} sites ready in {:.2f} s with {} processes ({} failed)'.format(
+        len(keys) - failed, len(site_list), time.perf_counter() - tic, workers, failed))
+
+    return failed
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    import sites
+
+    parser = argparse.ArgumentParser(description='Bring the cache of the counter exports up to date.')
+    parser.add_argument('site_url', nargs='*', help='only these sites (all of them by default)')
+    parser.add_argument('-j', '--workers', type=int, help='number of processes (the number of CPUs by default)')
+
+    args = parser.parse_args()
+
+    failed = warm([site for site in sites.site_list if not args.site_url or site['site_url'] in args.site_url],
+                  workers=args.workers)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,272 @@
+# A process-wide registry of the processed site datasets
+#
+# Each worker parses a site's counter, weather and notes data once and keeps
+# the typed dataframes in memory. The browser only stores a small key,
+# {'site': <site_url>, 'version': <data version>}, which the callbacks use
+# to look the dataset up again instead of shipping the data as JSON.
+# The weather and notes files are parsed once however many sites use them,
+# and the daily sums of a site are joined with them once, in a daily fact
+# table that the daily charts slice.
+#
+# The 15-min counts are memory maps of the cache files, so they are shared
+# by the workers of a machine. With gunicorn's preload_app (gunicorn.conf.py)
+# the master loads every site once before forking, and the workers start
+# with the registry already filled.
+
+import hashlib
+import os
+import threading
+import time
+
+import lazyimport
+
+pd = lazyimport.module('pandas')
+
+import counterseries
+import datacache
+import gaps
+import sites
+import utils
+import weekstats
+
+_datasets = {}   # (site_url, version) -> dataset dict
+
+_sources = {}   # path of a weather or notes file -> (file signature, parsed data)
+
+_lock = threading.Lock()
+
+_sources_lock = threading.Lock()
+
+
+# A function to find a site's configuration by its url
+def site_by_url(site_url):
+
+    for site in sites.site_list:
+
+        if site['site_url'] == site_url:
+
+            return site
+
+    raise KeyError(site_url)
+
+
+def _file_signature(path):
+
+    stat = os.stat(path)
+
+    return '{}:{}'.format(stat.st_mtime_ns, stat.st_size)
+
+
+# A function to get the parsed data of a weather or notes file: a file is read once
+# (and again only when it changes), however many sites use it
+def _source(path, parse, file_name):
+
+    signature = _file_signature(path)
+
+    with _sources_lock:
+
+        entry = _sources.get(path)
+
+        if entry is None or entry[0] != signature:
+
+            entry = (signature, parse(file_name))
+
+            _sources[path] = entry
+
+    return entry[1]
+
+
+# A function to get the daily weather of a weather file and its weekly and monthly averages
+def weather(weather_file_name):
+
+    return _source('./data/weather/' + weather_file_name, utils.weather_pyramid, weather_file_name)
+
+
+# A function to get the notes of a notes file
+def notes(note_file_name):
+
+    return _source('./data/notes/' + note_file_name, utils.note_data, note_file_name)
+
+
+# A function to build the daily fact table of a site from its daily sums
+def _daily_facts(site_config, df_daily):
+
+    return utils.daily_facts(df_daily,
+                             weather(site_config['weather_file_name'])['D'],
+                             notes(site_config['note_file_name']))
+
+
+# A function to get the signatures of the weather and notes files of a site
+# (and of the settings its data depends on)
+def _other_sources(site_config):
+
+    return [_file_signature('./data/weather/' + site_config['weather_file_name']),
+            _file_signature('./data/notes/' + site_config['note_file_name']),
+            site_config['date_range'][0],
+            str(site_config.get('gaps', []))]
+
+
+# A function to compute the data version of a site
+# (changes whenever its counter, weather or notes file or its date range changes)
+def data_version(site_config, meta=None):
+
+    if meta is None:
+        meta = datacache.ensure(site_config['data_file_name'], site_config['date_range'])
+
+    parts = [meta['sha256'], *_other_sources(site_config), site_config['date_range'][1]]
+
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:12]
+
+
+# A function to get the key stored in the browser for a site
+def dataset_key(site_config):
+
+    return {'site': site_config['site_url'], 'version': data_version(site_config)}
+
+
+# A function to load the dataset of a site
+def _load(site_config, version, meta):
+
+    gap_list = gaps.site_gaps(site_config, meta)
+
+    series = utils.counter_series(data_file_name=site_config['data_file_name'],
+                                  date_range=site_config['date_range'],
+                                  gap_list=gap_list)
+
+    pyramid = utils.build_pyramid(counterseries.to_frame(series, 'D'))
+
+    return dict(site=site_config['site_url'],
+                version=version,
+                counter_sha256=meta['sha256'],
+                other_sources=_other_sources(site_config),
+                gaps=gap_list,   # [first day, last day] of the gaps in the data
+                series=series,   # compact 15-min counts
+                week_stats=weekstats.build(series),   # hourly aggregates by day of week
+                pyramid=pyramid,   # daily, weekly and monthly sums
+                daily=_daily_facts(site_config, pyramid['D']),   # daily sums, weather and notes
+                weather_pyramid=weather(site_config['weather_file_name']),   # shared by the sites of a weather file
+                )
+
+
+# A function to update the dataset of a site after new counter data was appended to
+# its cache: only the aggregates from the first changed day on are recomputed
+def _update(dataset, site_config, version, meta):
+
+    gap_list = gaps.site_gaps(site_config, meta)
+
+    series = utils.counter_series(data_file_name=site_config['data_file_name'],
+                                  date_range=site_config['date_range'],
+                                  gap_list=gap_list)
+
+    # the new rows can also make a new gap (or end one) starting before the first changed slot
+    since = gaps.first_change(dataset['gaps'], gap_list)
+
+    if meta['update']['changed_from'] is not None:
+        changed_from = pd.Timestamp(meta['update']['changed_from']).normalize()
+        since = changed_from if since is None else min(since, changed_from)
+
+    pyramid, week_stats, daily = dataset['pyramid'], dataset['week_stats'], dataset['daily']
+
+    if since is not None:
+
+        pyramid = utils.update_pyramid(pyramid, counterseries.to_frame(series, 'D'), since)
+
+        week_stats = weekstats.update(week_stats, series, since)
+
+        # only the rows of the fact table from the first changed day on are joined again
+        daily = pd.concat([daily[daily.index < since], _daily_facts(site_config, pyramid['D'][since:])])
+
+    return dict(dataset,
+                version=version,
+                counter_sha256=meta['sha256'],
+                gaps=gap_list,
+                series=series,
+                week_stats=week_stats,
+                pyramid=pyramid,
+                daily=daily)
+
+
+# A function to check if a dataset can be updated to a new version of its counter data
+def _can_update(dataset, site_config, meta):
+
+    return (dataset is not None
+            and meta['update']['mode'] == 'appended'
+            and meta['update']['previous_sha256'] == dataset['counter_sha256']
+            and dataset['other_sources'] == _other_sources(site_config))
+
+
+# A function to get the (current) dataset of a site from its key
+def get(key):
+
+    site_config = site_by_url(key['site'])
+
+    meta = datacache.ensure(site_config['data_file_name'], site_config['date_range'])
+
+    version = data_version(site_config, meta)
+
+    dataset = _datasets.get((key['site'], version))
+
+    if dataset is not None:
+        return dataset
+
+    with _lock:
+
+        dataset = _datasets.get((key['site'], version))
+
+        if dataset is None:
+
+            old = [k for k in _datasets if k[0] == key['site']]
+
+            previous = _datasets[old[-1]] if old else None
+
+            if _can_update(previous, site_config, meta):
+                dataset = _update(previous, site_config, version, meta)
+            else:
+                dataset = _load(site_config, version, meta)
+
+            # drop the outdated versions of this site
+            for k in old:
+                del _datasets[k]
+
+            _datasets[(key['site'], version)] = dataset
+
+    return dataset
+
+
+# A function to get the dataset of a key if it is already loaded (None otherwise)
+def loaded(key):
+
+    return _datasets.get((key['site'], key['version']))
+
+
+# A function to load the datasets of all the sites into the registry. A site that fails
+# to load is reported and skipped: it is loaded again on its first request.
+def preload(site_list=None):
+
+    for site in site_list or sites.site_list:
+
+        tic = time.perf_counter()
+
+        try:
+            dataset = get(dataset_key(site))
+        except Exception as error:   # the other sites are still served
+            print('{}: dataset not loaded, {}: {}'.format(site['site_url'], type(error).__name__, error))
+            continue
+
+        print('{}: dataset {} loaded ({:,} slots, {:.2f} s)'.format(
+            site['site_url'], dataset['version'], dataset['series']['slots'], time.perf_counter() - tic))
+
+
+# A function to get the sums of a dataset at a resample rule over a date range,
+# with the day of week of each row (and the weather and notes of each day for 'D')
+def select(dataset, rule, start_date, end_date):
+
+    if rule == 'D':
+        return utils.df_select(dataset['daily'], start_date, end_date)   # a slice of the fact table
+
+    if rule in counterseries.rule_slots:
+        df = counterseries.to_frame(dataset['series'], rule, start_date, end_date)
+    else:
+        df = dataset['pyramid'][rule]
+
+    return utils.df_filter(df, start_date=start_date, end_date=end_date)
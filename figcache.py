@@ -0,0 +1,199 @@
+# A bounded cache of the figures and tables returned by the callbacks
+#
+# The outputs are keyed on the callback inputs (site, data version,
+# direction, resolution, dates, checklists, rain filter), so the same view
+# asked by many users is only built once. Entries are evicted by size,
+# least recently used first.
+#
+# By default the cache lives in the memory of each worker. Set
+# FIGURE_CACHE_DIR to a local folder to share it between the gunicorn
+# workers of a machine, and FIGURE_CACHE_SIZE_MB to change its size
+# (0 turns the cache off).
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+cache_dir = os.environ.get('FIGURE_CACHE_DIR')
+
+max_bytes = int(float(os.environ.get('FIGURE_CACHE_SIZE_MB', 64)) * 2**20)
+
+_memory = OrderedDict()   # key -> pickled output, oldest first
+
+_memory_bytes = 0
+
+_lock = threading.Lock()
+
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+# A function to build the cache key of a callback call
+def make_key(name, args):
+
+    text = json.dumps([name, args], sort_keys=True, default=str)
+
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _count(counter, n=1):
+
+    with _lock:
+        _counters[counter] += n
+
+
+# In-memory backend
+
+def _memory_get(key):
+
+    with _lock:
+
+        blob = _memory.get(key)
+
+        if blob is not None:
+            _memory.move_to_end(key)
+
+    return blob
+
+
+def _memory_set(key, blob):
+
+    global _memory_bytes
+
+    with _lock:
+
+        if key in _memory:
+            _memory_bytes -= len(_memory.pop(key))
+
+        _memory[key] = blob
+        _memory_bytes += len(blob)
+
+        while _memory_bytes > max_bytes and _memory:
+            _memory_bytes -= len(_memory.popitem(last=False)[1])
+            _counters['evictions'] += 1
+
+
+# File backend (shared by the workers, the file mtime is the last access time)
+
+def _file_path(key):
+
+    return os.path.join(cache_dir, key + '.pkl')
+
+
+def _file_get(key):
+
+    path = _file_path(key)
+
+    try:
+        with open(path, 'rb') as f:
+            blob = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+
+    return blob
+
+
+def _file_set(key, blob):
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    tmp = _file_path(key) + '.{}.tmp'.format(os.getpid())
+
+    with open(tmp, 'wb') as f:
+        f.write(blob)
+
+    os.replace(tmp, _file_path(key))
+
+    entries = []
+
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.pkl'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+
+        if total <= max_bytes:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        total -= size
+        _count('evictions')
+
+
+# A function to get a cached output (None if it is not cached)
+def lookup(key):
+
+    blob = _file_get(key) if cache_dir else _memory_get(key)
+
+    if blob is None:
+        return None
+
+    return pickle.loads(blob)
+
+
+# A function to cache an output
+def store(key, value):
+
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if len(blob) > max_bytes:
+        return
+
+    if cache_dir:
+        _file_set(key, blob)
+    else:
+        _memory_set(key, blob)
+
+
+# A function to get an output from the cache, building (and caching) it on a miss
+def cached(name, key_args, build):
+
+    if max_bytes <= 0:
+        return build()
+
+    key = make_key(name, key_args)
+
+    value = lookup(key)
+
+    if value is not None:
+        _count('hits')
+        return value
+
+    _count('misses')
+
+    value = build()
+
+    store(key, value)
+
+    return value
+
+
+# A function to get the hit/miss counters and the size of the cache
+def stats():
+
+    with _lock:
+        result = dict(_counters)
+
+    if cache_dir:
+        sizes = [entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith('.pkl')] if os.path.isdir(cache_dir) else []
+        result.update(backend='file', entries=len(sizes), bytes=sum(sizes))
+    else:
+        with _lock:
+            result.update(backend='memory', entries=len(_memory), bytes=_memory_bytes)
+
+    result['max_bytes'] = max_bytes
+
+    return result
@@ -0,0 +1,89 @@
+# The gap index of a site: the sorted date intervals without counter data
+#
+# A gap is a run of whole days during which the counter did not record:
+#   - the intervals listed in the site's 'gaps' ([[first day, last day], ...]
+#     in data/sites.json), e.g. a counter removed for the winter
+#   - the runs of days without any data in the counter export
+#   - the runs of at least config.gap_min_zero_days days counting nothing in
+#     both directions (a counter left in place but switched off)
+# The runs of empty days are found once when the export is ingested (see
+# datacache.empty_days). The intervals are merged and clipped to the site's
+# date range, so the masking, the days with data and the chart rangebreaks
+# only walk the (few) gaps instead of the series.
+
+import lazyimport
+
+pd = lazyimport.module('pandas')
+
+import config
+import counterseries
+
+
+# A function to merge overlapping or adjacent [first day, last day] intervals (Timestamps)
+def merge(intervals):
+
+    merged = []
+
+    for first, last in sorted(intervals):
+
+        if merged and first <= merged[-1][1] + pd.Timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+
+    return merged
+
+
+# A function to build the gap index of a site from its configuration and the metadata of its cache
+def site_gaps(site_config, meta):
+
+    intervals = [[pd.Timestamp(first), pd.Timestamp(last)] for first, last in site_config.get('gaps', [])]
+
+    intervals += [[pd.Timestamp(first), pd.Timestamp(last)] for first, last in meta['empty_days']['missing']]
+
+    intervals += [[pd.Timestamp(first), pd.Timestamp(last)] for first, last in meta['empty_days']['zero']
+                  if (pd.Timestamp(last) - pd.Timestamp(first)).days + 1 >= config.gap_min_zero_days]
+
+    first_day, last_day = (pd.Timestamp(day) for day in site_config['date_range'])
+
+    return [[max(first, first_day), min(last, last_day)] for first, last in merge(intervals)
+            if last >= first_day and first <= last_day]
+
+
+# A function to mark the slots of the gaps of a site as missing in its 15-min series
+def mask(series, gap_list):
+
+    return counterseries.mask_dates(series, gap_list)
+
+
+# A function to find the first day of the gaps found in only one of two gap indexes
+# (the days from which a series masked with one differs from the other), None if there is none
+def first_change(gap_list, other):
+
+    changed = [first for first, last in gap_list if [first, last] not in other]
+    changed += [first for first, last in other if [first, last] not in gap_list]
+
+    return min(changed, default=None)
+
+
+# A function to count the days of the gaps within a date range (both dates included)
+def days_in_gaps(gap_list, start_date, end_date):
+
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    return sum(max((min(last, end_date) - max(first, start_date)).days + 1, 0) for first, last in gap_list)
+
+
+# A function to count the days with data within a date range (both dates included)
+def days_with_data(gap_list, start_date, end_date):
+
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+
+    return max(days, 0) - days_in_gaps(gap_list, start_date, end_date)
+
+
+# A function to get the x axis rangebreaks hiding the gaps of at least a number of days
+def rangebreaks(gap_list, min_days):
+
+    return [dict(bounds=[str(first.date()), str((last + pd.Timedelta(days=1)).date())])
+            for first, last in gap_list if (last - first).days + 1 >= min_days]
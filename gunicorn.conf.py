@@ -0,0 +1,27 @@
+# gunicorn settings (read automatically by `gunicorn app:server`)
+#
+# The app is imported once in the master process and every site's dataset is
+# loaded before the workers are forked: the workers share these pages
+# (copy-on-write, and the 15-min counts are memory maps of data/cache/), so
+# a new or restarted worker serves its first request without loading anything.
+# The counter caches are brought up to date first, the exports in parallel
+# (see datacache.warm), so this works where nothing runs before the server
+# (Cloud Run, or a Heroku dyno whose files are not kept from the release
+# phase). A site that fails to load is skipped (and loaded on its first request).
+
+import os
+
+import datacache
+import datastore
+import sites
+
+preload_app = True
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+
+def on_starting(server):
+
+    datacache.warm(sites.site_list)   # the exports in parallel, the failures are reported
+
+    datastore.preload()
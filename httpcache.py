@@ -0,0 +1,167 @@
+# HTTP compression and caching of the responses of the app
+#
+# The responses of at least HTTP_COMPRESS_MIN_SIZE bytes (1000 by default)
+# with a text type (the JSON of the callback outputs and of the layout, the
+# pages, the JavaScript and CSS of the dash components) are compressed with
+# brotli, if the brotli package is installed and the browser accepts it, or
+# else with gzip. Set HTTP_COMPRESSION=0 to turn it off (for example when a
+# reverse proxy compresses the responses).
+#
+# The GET responses of the app that do not set their own caching headers
+# (the page, the layout, the callback graph) get an ETag, the hash of their
+# body, and `Cache-Control: no-cache`: a browser or a proxy can keep them and
+# revalidate them with If-None-Match, and gets an empty 304 response when they
+# have not changed.
+#
+# The compressed bodies of the static files (the JavaScript of the dash
+# components, which set their own caching headers) are kept, the last
+# compressed_cache_size ones, so they are only compressed once per worker.
+#
+# The callback outputs are POST requests, which browsers and proxies do not
+# reuse: they are only compressed. The same view asked again is reused on
+# the server by the figure cache (see figcache.py).
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+enabled = os.environ.get('HTTP_COMPRESSION', '1') == '1'
+
+min_size = int(os.environ.get('HTTP_COMPRESS_MIN_SIZE', 1000))
+
+gzip_level = 6
+
+brotli_quality = 5
+
+compressed_cache_size = 32
+
+# Types of the responses that are compressed (images and fonts are compressed already)
+compressible_types = ['application/json', 'application/javascript', 'text/html', 'text/css',
+                      'text/javascript', 'text/plain', 'image/svg+xml']
+
+_compressed = OrderedDict()   # (path, etag, encoding) -> compressed body of a static file, oldest first
+
+_lock = threading.Lock()
+
+
+# A function to pick the encoding of a response from the Accept-Encoding header of the request
+def _encoding(request):
+
+    accepted = request.accept_encodings
+
+    if brotli is not None and accepted['br']:
+        return 'br'
+
+    if accepted['gzip']:
+        return 'gzip'
+
+    return None
+
+
+# A function to compress the body of a response with gzip or brotli
+def _compress(data, encoding):
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+
+    return gzip.compress(data, compresslevel=gzip_level)
+
+
+# A function to get the compressed body of a static file from the cache, compressing it once
+def _cached_compress(data, key):
+
+    encoding = key[-1]
+
+    with _lock:
+        if key in _compressed:
+            _compressed.move_to_end(key)
+            return _compressed[key]
+
+    body = _compress(data, encoding)
+
+    with _lock:
+
+        _compressed[key] = body
+
+        while len(_compressed) > compressed_cache_size:
+            _compressed.popitem(last=False)
+
+    return body
+
+
+# A function to add the ETag and Cache-Control headers of a GET response, and answer
+# 304 Not Modified if the browser already has it
+def _add_cache_headers(response, request):
+
+    if 'ETag' in response.headers or 'Cache-Control' in response.headers:
+        return response
+
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+
+    response.headers['Cache-Control'] = 'no-cache'
+
+    return response.make_conditional(request)
+
+
+# A function to compress a response if the browser accepts it and it is big enough
+def _add_compression(response, request, static):
+
+    if response.mimetype not in compressible_types or 'Content-Encoding' in response.headers:
+        return response
+
+    data = response.get_data()
+
+    if len(data) < min_size:
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = _encoding(request)
+
+    if encoding is None:
+        return response
+
+    if static:
+        body = _cached_compress(data, (request.full_path, response.get_etag()[0], encoding))
+    else:
+        body = _compress(data, encoding)
+
+    response.set_data(body)
+
+    response.headers['Content-Encoding'] = encoding
+
+    return response
+
+
+# A function to add the caching headers and the compression of a response (a flask after_request hook)
+def after_request(response):
+
+    request = flask.request
+
+    if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+        return response
+
+    static = False
+
+    if request.method == 'GET':
+
+        static = 'ETag' in response.headers or 'Cache-Control' in response.headers
+
+        response = _add_cache_headers(response, request)
+
+        if response.status_code != 200:
+            return response   # 304 Not Modified
+
+    if enabled:
+        response = _add_compression(response, request, static)
+
+    return response
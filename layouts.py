@@ -2,9 +2,6 @@ from dash import dcc, html, dash_table
 import config
 import sites
 
-import numpy as np
-import pandas as pd
-
 def call_layout(site_config):
 
     layout = html.Div([
@@ -71,13 +68,14 @@ def call_layout(site_config):
         html.Div(id='table-div',
             children=[
             html.H3(children='Traffic summary on the selected dates'),
-            dash_table.DataTable(data=pd.DataFrame(np.zeros((3, 4))).to_dict('records'),
+            dash_table.DataTable(data=[dict.fromkeys(range(5), 0.0) for _ in range(3)],
                                  columns=[
                 dict(id='dir', name=''),
                 dict(id='total_vol', name='Total traffic', type='numeric',
                      format=dash_table.Format.Format().group(True)),
                 dict(id='daily_avg', name='Average daily traffic', type='numeric', format=dash_table.Format.Format(
                         precision=1, scheme=dash_table.Format.Scheme.fixed)),
+                dict(id='days', name='Days with data', type='numeric'),
                 dict(id='perc', name='Percent', type='numeric',
                      format=dash_table.FormatTemplate.percentage(1))
             ],
@@ -85,16 +83,45 @@ def call_layout(site_config):
                 {'if': {'column_id': 'dir'},
                  'width': '25%'},
                 {'if': {'column_id': 'total_vol'},
-                 'width': '25%'},
+                 'width': '20%'},
                 {'if': {'column_id': 'daily_avg'},
-                 'width': '25%'},
-                {'if': {'column_id': 'perc'},
                  'width': '20%'},
+                {'if': {'column_id': 'days'},
+                 'width': '15%'},
+                {'if': {'column_id': 'perc'},
+                 'width': '15%'},
             ],
                 style_cell={'font-family': 'Roboto',
                             'padding-right': '10px', 
                             'padding-left': '10px'},
                 id='avg-table'),
+            html.Br(),
+            dash_table.DataTable(data=[dict.fromkeys(range(5), 0.0) for _ in range(3)],
+                                 columns=[
+                dict(id='dir', name=''),
+                dict(id='weekday_avg', name='Average weekday traffic', type='numeric', format=dash_table.Format.Format(
+                        precision=1, scheme=dash_table.Format.Scheme.fixed)),
+                dict(id='weekend_avg', name='Average weekend day traffic', type='numeric', format=dash_table.Format.Format(
+                        precision=1, scheme=dash_table.Format.Scheme.fixed)),
+                dict(id='peak_day', name='Busiest day'),
+                dict(id='peak_hour', name='Busiest hour'),
+            ],
+                style_cell_conditional=[
+                {'if': {'column_id': 'dir'},
+                 'width': '25%'},
+                {'if': {'column_id': 'weekday_avg'},
+                 'width': '15%'},
+                {'if': {'column_id': 'weekend_avg'},
+                 'width': '15%'},
+                {'if': {'column_id': 'peak_day'},
+                 'width': '20%'},
+                {'if': {'column_id': 'peak_hour'},
+                 'width': '25%'},
+            ],
+                style_cell={'font-family': 'Roboto',
+                            'padding-right': '10px', 
+                            'padding-left': '10px'},
+                id='peak-table'),
         ]),
 
         html.Div(id='time-of-day-div',
@@ -147,9 +174,7 @@ def call_layout(site_config):
         ]),
 
         # dcc.Store stores the values
-        dcc.Store(id='intermediate-value'),
-        dcc.Store(id='weather-value'),
-        dcc.Store(id='daily-notes'),
+        dcc.Store(id='dataset-key'),   # key of the site dataset kept on the server
         dcc.Store(id='site-config'),
 
     ])
@@ -157,19 +182,82 @@ def call_layout(site_config):
     return layout
 
 
+compare_url = '/compare'
+
+
+# A function to get the names of a direction ('in' or 'out') of a list of sites, e.g. 'Northbound / Eastbound'
+def direction_names(site_list, direction):
+
+    return ' / '.join(dict.fromkeys(site['config_direction'][direction] for site in site_list))
+
+
+# The layout of the page comparing the daily traffic of all the sites
+def call_compare_layout(site_list):
+
+    first_day = min(site['date_range'][0] for site in site_list)
+    last_day = max(site['date_range'][1] for site in site_list)
+
+    layout = html.Div([
+
+        html.Div(id='dash-header',
+                 children=[
+                    html.H1(children=config.title),
+                    html.H3(children='Daily traffic of all the bike counters'),
+                ]),
+
+        html.Div(id='dash-controls',
+                 children=[
+                    html.Div(id='select-date-range',
+                            children=[
+                                html.Span(children='Select dates', style={'font-weight': 'bold'}),
+                                dcc.DatePickerRange(id='compare-date-picker-range',
+                                                        min_date_allowed=first_day,
+                                                        max_date_allowed=last_day,
+                                                        start_date=first_day,
+                                                        end_date=last_day,
+                                                        first_day_of_week=1,  # start on Mondays
+                                                        minimum_nights=0,
+                                                        updatemode='singledate',
+                                                        ),
+                            ]),
+
+                    html.Div(id='select-direction',
+                            children=[
+                                html.Span(children='Traffic direction', style={'font-weight': 'bold'}),
+                                dcc.RadioItems(options={'bi_direction': 'Both',
+                                                        'in': direction_names(site_list, 'in') + ' only',
+                                                        'out': direction_names(site_list, 'out') + ' only'},
+                                                value='bi_direction',
+                                                inputStyle={"margin-left": "10px"},
+                                                inline=True,
+                                                id='compare-dir-radio'),
+                            ]),
+                 ]),
+
+        html.Div(children=[dcc.Graph(id='compare-heatmap',
+                                     config={'toImageButtonOptions': {'format': 'png', 'filename': 'daily_traffic_by_counter', 'height': None, 'width': None, 'scale': 10}, 'displaylogo': False})]),
+
+        html.Div(children=[dcc.Graph(id='compare-totals',
+                                     config={'toImageButtonOptions': {'format': 'png', 'filename': 'total_traffic_by_counter', 'height': None, 'width': None, 'scale': 10}, 'displaylogo': False})]),
+
+        html.Div(id='footer',
+        children=[
+            html.H4(children=dcc.Link('Back to the list of bike counters', href='/')),
+        ]),
+    ])
+
+    return layout
+
+
 home_layout = html.Div(children=[
     html.H1(children='Bike counter dashboard'),
 
     html.H3(children='Select a bike counter below to see its dashboard.'),
 
     html.Div([html.Br(),
-              dcc.Link(sites.site_01['site_title'], href=sites.site_01['site_url']),
-              html.Br(),
-              html.Br(),
-              dcc.Link(sites.site_02['site_title'], href=sites.site_02['site_url']),
-              html.Br(),
-              html.Br(),
-              dcc.Link(sites.site_03['site_title'], href=sites.site_03['site_url']),
+              *[element for site in sites.site_list
+                for element in [dcc.Link(site['site_title'], href=site['site_url']), html.Br(), html.Br()]],
+              dcc.Link('Compare all the bike counters', href=compare_url),
               html.Br(),
               html.Br(),
     ]),
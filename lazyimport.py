@@ -0,0 +1,76 @@
+# Deferred imports of the heavy modules, for a faster start of the web workers
+#
+# The modules of the app import pandas, numpy and plotly.express with
+#
+#     pd = lazyimport.module('pandas')
+#
+# which returns a stand-in for the module: the module is only imported the
+# first time one of its attributes is used, i.e. when the first dashboard is
+# built instead of when a worker boots. The time each deferred module takes
+# to import (including the modules it imports) is recorded in import_times.
+#
+# Set LAZY_IMPORTS=0 to import every module at startup instead.
+
+import importlib
+import os
+import sys
+import threading
+import time
+
+enabled = os.environ.get('LAZY_IMPORTS', '1') != '0'
+
+import_times = {}   # module name -> seconds taken by its first use
+
+_deferred = set()   # names of the deferred modules
+
+_lock = threading.Lock()
+
+
+# A stand-in for a module, importing it on the first use of one of its attributes
+class _DeferredModule:
+
+    def __init__(self, name):
+
+        self._name = name
+
+    def __getattr__(self, attr):
+
+        return getattr(_import(self._name), attr)
+
+    def __repr__(self):
+
+        return "<deferred module '{}'>".format(self._name)
+
+
+def _import(name):
+
+    if name not in import_times:
+
+        with _lock:
+
+            if name not in import_times:
+
+                tic = time.perf_counter()
+
+                importlib.import_module(name)
+
+                import_times[name] = time.perf_counter() - tic
+
+    return sys.modules[name]
+
+
+# A function to get a module to import on its first use (or right away if disabled)
+def module(name):
+
+    if not enabled:
+        return importlib.import_module(name)
+
+    _deferred.add(name)
+
+    return _DeferredModule(name)
+
+
+# A function to get the names of the deferred modules not used yet
+def pending():
+
+    return sorted(name for name in _deferred if name not in import_times)
@@ -0,0 +1,63 @@
+# Aggregates across many bike counter sites
+#
+# daily_matrix() returns the daily counts of a list of sites over a date range
+# as one aligned matrix (sites x days). The daily sums of a site are the ones
+# of its dataset when it is loaded in the registry (see datastore.py); the
+# other sites are summed by day straight from the memory maps of their cache
+# (see datacache.py), without loading the whole dataset (the weekday
+# statistics, the weather and the notes), which takes milliseconds per site.
+
+import lazyimport
+
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
+
+import counterseries
+import datacache
+import datastore
+import gaps
+import utils
+
+
+# A function to get the daily sums of a site ('in', 'out' and 'bi_direction' columns,
+# without the gaps of the site)
+def _site_daily(site):
+
+    meta = datacache.ensure(site['data_file_name'], site['date_range'])
+
+    dataset = datastore.loaded({'site': site['site_url'], 'version': datastore.data_version(site, meta)})
+
+    if dataset is not None:
+        return dataset['pyramid']['D']
+
+    series = utils.counter_series(site['data_file_name'], site['date_range'], gaps.site_gaps(site, meta))
+
+    return counterseries.to_frame(series, 'D')
+
+
+# A function to get the daily sums of every site of a list
+def daily_frames(site_list):
+
+    return {site['site_url']: _site_daily(site) for site in site_list}
+
+
+# A function to get the daily counts of a column ('in', 'out' or 'bi_direction') of a
+# list of sites over a date range (both dates included) as a dataframe: one row per
+# site (indexed by site_url), one column per day, NaN where a site has no data
+def daily_matrix(site_list, start_date, end_date, col='bi_direction'):
+
+    frames = daily_frames(site_list)
+
+    days = pd.date_range(start_date, end_date, freq='D', name='time')
+
+    data = np.full((len(site_list), len(days)), np.nan)
+
+    for row, site in enumerate(site_list):
+
+        df = utils.df_select(frames[site['site_url']], start_date, end_date)
+
+        if len(df):
+            first = (df.index[0] - days[0]).days
+            data[row, first:first + len(df)] = df[col].to_numpy()
+
+    return pd.DataFrame(data, index=pd.Index([site['site_url'] for site in site_list], name='site'), columns=days)
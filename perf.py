@@ -0,0 +1,239 @@
+# Latency instrumentation of the callbacks
+#
+# Set PERF_METRICS=1 to time every call of the callbacks (see perf.instrument
+# in app.py and callbacks.py): the total time, the time of the stages marked
+# with perf.stage (slicing the data, building each output) and the time and
+# size of the JSON serialization of the outputs sent to the browser. The last
+# PERF_BUFFER_SIZE calls (1000 by default) are kept in memory, per worker,
+# and shown at /metrics (Prometheus text format) and /_perf (HTML tables).
+#
+# When PERF_METRICS is off the callbacks are not wrapped at all and perf.stage
+# returns a shared no-op context manager.
+
+import collections
+import contextlib
+import functools
+import html
+import os
+import threading
+import time
+
+enabled = os.environ.get('PERF_METRICS', '0') == '1'
+
+buffer_size = int(os.environ.get('PERF_BUFFER_SIZE', 1000))
+
+quantiles = [0.5, 0.95]
+
+_records = collections.deque(maxlen=buffer_size)   # the last calls, oldest first
+
+_totals = {}   # callback name -> {'count': calls, 'seconds_sum': total time, 'bytes_sum': total payload}
+
+_lock = threading.Lock()
+
+_local = threading.local()   # the record of the call running in this thread
+
+_off = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _timed(name):
+
+    record = getattr(_local, 'record', None)
+
+    tic = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        if record is not None:
+            record['stages'][name] = record['stages'].get(name, 0) + time.perf_counter() - tic
+
+
+# A function to time a stage of the running callback: `with perf.stage(name): ...`
+def stage(name):
+
+    if not enabled:
+        return _off
+
+    return _timed(name)
+
+
+# A function to get the size of the outputs of a callback serialized to JSON (like dash does it)
+def _payload_bytes(output):
+
+    from plotly.io.json import to_json_plotly
+
+    return len(to_json_plotly(output).encode())
+
+
+# A decorator to record the timings of the calls of a callback (placed under @callback)
+def instrument(name):
+
+    def decorator(func):
+
+        if not enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+
+            record = dict(callback=name, time=time.time(), stages={})
+
+            _local.record = record
+
+            tic = time.perf_counter()
+
+            try:
+                output = func(*args, **kwargs)
+
+                with _timed('serialize'):
+                    record['bytes'] = _payload_bytes(output)
+
+            finally:
+                _local.record = None
+
+            record['seconds'] = time.perf_counter() - tic
+
+            with _lock:
+
+                _records.append(record)
+
+                totals = _totals.setdefault(name, {'count': 0, 'seconds_sum': 0.0, 'bytes_sum': 0})
+                totals['count'] += 1
+                totals['seconds_sum'] += record['seconds']
+                totals['bytes_sum'] += record['bytes']
+
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+# A function to get the quantile of a list of values (nearest rank)
+def _quantile(values, q):
+
+    values = sorted(values)
+
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def _quantiles(values):
+
+    return {q: _quantile(values, q) for q in quantiles} if values else {}
+
+
+# A function to summarize the calls of each callback: the call count and sums since the
+# start, and the quantiles of the time, payload size and stage times of the recent calls
+def summary():
+
+    with _lock:
+        records = list(_records)
+        totals = {name: dict(callback_totals) for name, callback_totals in _totals.items()}
+
+    result = {}
+
+    for name, callback_totals in sorted(totals.items()):
+
+        calls = [record for record in records if record['callback'] == name]
+
+        stage_names = sorted({stage_name for record in calls for stage_name in record['stages']})
+
+        result[name] = dict(callback_totals,
+                            recent=len(calls),
+                            seconds=_quantiles([record['seconds'] for record in calls]),
+                            bytes=_quantiles([record['bytes'] for record in calls]),
+                            stages={stage_name: _quantiles([record['stages'][stage_name] for record in calls
+                                                            if stage_name in record['stages']])
+                                    for stage_name in stage_names})
+
+    return result
+
+
+# A function to render the summary in the Prometheus text format
+def prometheus_text():
+
+    stats = summary()
+
+    lines = ['# HELP dash_callback_seconds Time of the callback calls, including the serialization of the outputs.',
+             '# TYPE dash_callback_seconds summary']
+
+    for name, s in stats.items():
+
+        for q, value in s['seconds'].items():
+            lines.append('dash_callback_seconds{{callback="{}",quantile="{}"}} {:.6f}'.format(name, q, value))
+
+        lines.append('dash_callback_seconds_sum{{callback="{}"}} {:.6f}'.format(name, s['seconds_sum']))
+        lines.append('dash_callback_seconds_count{{callback="{}"}} {}'.format(name, s['count']))
+
+    lines += ['# HELP dash_callback_payload_bytes Size of the JSON outputs of the callback calls.',
+              '# TYPE dash_callback_payload_bytes summary']
+
+    for name, s in stats.items():
+
+        for q, value in s['bytes'].items():
+            lines.append('dash_callback_payload_bytes{{callback="{}",quantile="{}"}} {}'.format(name, q, value))
+
+        lines.append('dash_callback_payload_bytes_sum{{callback="{}"}} {}'.format(name, s['bytes_sum']))
+        lines.append('dash_callback_payload_bytes_count{{callback="{}"}} {}'.format(name, s['count']))
+
+    lines += ['# HELP dash_callback_stage_seconds Time of the stages of the recent callback calls.',
+              '# TYPE dash_callback_stage_seconds gauge']
+
+    for name, s in stats.items():
+
+        for stage_name, stage_quantiles in s['stages'].items():
+
+            for q, value in stage_quantiles.items():
+                lines.append('dash_callback_stage_seconds{{callback="{}",stage="{}",quantile="{}"}} {:.6f}'.format(
+                    name, stage_name, q, value))
+
+    return '\n'.join(lines) + '\n'
+
+
+# A function to render the summary and the last calls as an HTML page
+def html_page(last=50):
+
+    stats = summary()
+
+    with _lock:
+        records = list(_records)[-last:]
+
+    def row(cells, tag='td'):
+        return '<tr>' + ''.join('<{0}>{1}</{0}>'.format(tag, html.escape(str(cell))) for cell in cells) + '</tr>'
+
+    def ms(seconds):
+        return '' if seconds is None else '{:.1f}'.format(seconds * 1000)
+
+    def kb(size):
+        return '' if size is None else '{:.1f}'.format(size / 1000)
+
+    parts = ['<html><head><title>Callback timings</title></head><body style="font-family: sans-serif">',
+             '<h3>Callbacks (time in ms, quantiles over the last {} calls kept)</h3>'.format(buffer_size),
+             '<table border="1" cellpadding="4">',
+             row(['callback', 'stage', 'calls', 'p50', 'p95', 'p50 payload (kB)', 'p95 payload (kB)'], 'th')]
+
+    for name, s in stats.items():
+
+        parts.append(row([name, 'total', s['count'], *[ms(s['seconds'].get(q)) for q in quantiles],
+                          *[kb(s['bytes'].get(q)) for q in quantiles]]))
+
+        for stage_name, stage_quantiles in s['stages'].items():
+            parts.append(row(['', stage_name, '', *[ms(stage_quantiles[q]) for q in quantiles], '', '']))
+
+    parts += ['</table>',
+              '<h3>Last calls</h3>',
+              '<table border="1" cellpadding="4">',
+              row(['time', 'callback', 'total (ms)', 'payload (kB)', 'stages (ms)'], 'th')]
+
+    for record in reversed(records):
+
+        parts.append(row([time.strftime('%H:%M:%S', time.localtime(record['time'])),
+                          record['callback'],
+                          ms(record['seconds']),
+                          kb(record['bytes']),
+                          ', '.join('{} {}'.format(stage_name, ms(seconds)) for stage_name, seconds in record['stages'].items())]))
+
+    parts += ['</table>', '</body></html>']
+
+    return '\n'.join(parts)
@@ -0,0 +1,70 @@
+# Least squares fits of straight lines (y = slope * x + intercept)
+#
+# The fits are computed in closed form from the sufficient statistics of the
+# points (count, means, sums of squares and of products of the deviations),
+# for one or many groups of points at once, so the weather chart does not need
+# statsmodels.
+
+import lazyimport
+
+np = lazyimport.module('numpy')
+
+
+# A function to compute the sufficient statistics of the points of each group
+# (groups are integer codes from 0; all the points are one group if None): the count,
+# the means and the sums of squares and of products of the deviations from the means
+# (centering first keeps the precision for large values, like times in ms).
+# Points with a NaN coordinate are left out.
+def sufficient_stats(x, y, groups=None):
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    valid = ~(np.isnan(x) | np.isnan(y))
+
+    x, y = x[valid], y[valid]
+
+    groups = np.zeros(len(x), dtype=int) if groups is None else np.asarray(groups)[valid]
+
+    size = groups.max() + 1 if len(groups) else 1
+
+    def total(weights=None):
+        return np.bincount(groups, weights=weights, minlength=size)
+
+    n = total()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = total(x) / n
+        my = total(y) / n
+
+    dx = x - mx[groups]
+    dy = y - my[groups]
+
+    return dict(n=n,
+                mx=mx,
+                my=my,
+                sxx=total(dx * dx),
+                sxy=total(dx * dy),
+                syy=total(dy * dy))
+
+
+# A function to fit a line to each group from its sufficient statistics.
+# Returns the slope, intercept, R² and number of points of each group
+# (NaN for a group with fewer than 2 distinct x values).
+def fit(stats):
+
+    sxx, sxy, syy = stats['sxx'], stats['sxy'], stats['syy']
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        slope = np.where(sxx > 0, sxy / sxx, np.nan)
+        intercept = stats['my'] - slope * stats['mx']
+        rsquared = np.where(syy > 0, sxy ** 2 / (sxx * syy), np.nan)
+
+    return dict(slope=slope, intercept=intercept, rsquared=rsquared, n=stats['n'])
+
+
+# A function to fit one line to the points (x, y); returns the scalar parameters
+def fit_line(x, y):
+
+    return {name: value[0] for name, value in fit(sufficient_stats(x, y)).items()}
@@ -1,45 +1,51 @@
 # Bike counter site information
+#
+# The sites are listed in data/sites.json (or the file given by the SITES_FILE
+# environment variable), one object per site with:
+#
+#   site_url           the path of the site's dashboard, e.g. '/annarbor-1'
+#   site_title         the title of the link on the home page
+#   data_file_name     the counter export in data/counter/
+#   weather_file_name  the daily weather in data/weather/
+#   note_file_name     the daily notes in data/notes/
+#   config_direction   the names of the 'in' and 'out' directions
+#   loc_msg_markdown   the location shown under the dashboard title
+#   dates_msg          a description of the data collection dates
+#   date_range         [the first full *day* of data collection, the last day]
+#   default_res        the default resolution of the bar chart (e.g. '1_day')
+#   gaps               (optional) [[first day, last day], ...] of no recording,
+#                      in addition to the ones found in the data (see gaps.py)
 
-site_01 = dict(site_url='/annarbor-1',
-               site_title='Ann Arbor Division Street Protected Bike Lane',
-               data_file_name='export_data_domain_7992.xlsx',
-               weather_file_name='weather-noaa-annarbor.csv',
-               note_file_name='notes-annarbor.csv',
-               config_direction={'in': 'Northbound',
-                                 'out': 'Southbound'},
-               loc_msg_markdown='[Ann Arbor Division Street Protected Bike Lane](https://www.a2dda.org/people-friendly-streets/projects/division-street-bikeway-project/) | [Site photo](https://fenggroup.org/images/respic/bike-counter-a2division.png) | [Site location](https://goo.gl/maps/1bcfHrqSYbqiRSXa8)',
-               dates_msg='Data collection: 2022: Aug 26 to Nov 19, 2023: May 1 to present',
-               date_range=['2022-08-26',   # the first full *day* of data collection
-                           '2023-11-25'],
-               default_res='1_day',
-              )
-
-site_02 = dict(site_url='/dearborn-1',
-               site_title='Dearborn Rouge Getaway Trail (2022-06-15 to 2022-07-19)',
-               data_file_name='bike_data_dearborn.xlsx',
-               weather_file_name='weather-noaa-dearborn.csv',
-               note_file_name='notes-dearborn.csv',
-               config_direction={'in': 'Eastbound',
-                                 'out': 'Westbound'},
-               loc_msg_markdown='Location: Rouge Gateway Trail, Dearborn, MI (Site photo, [Google Maps](https://goo.gl/maps/WzSvLWxtkyoro9oK8))',
-               dates_msg='Data collection: 5 weeks (2022-06-15 to 2022-07-19)',
-               date_range=['2022-06-15',    # the first full *day* of data collection
-                           '2022-07-19'],
-               default_res='1_day',
-              )
-
-site_03 = dict(site_url='/dearborn-2',
-               site_title='Dearborn Rouge Getaway Trail (2022-10-08 to 2022-10-29)',
-               data_file_name='bike_dearborn_counter.xlsx',
-               weather_file_name='weather-noaa-dearborn.csv',
-               note_file_name='notes-dearborn.csv',
-               config_direction={'in': 'Eastbound',
-                                 'out': 'Westbound'},
-               loc_msg_markdown='Location: Rouge Gateway Trail, Dearborn, MI (Site photo, [Google Maps](https://goo.gl/maps/pBYh8FBJJ9cSNj9S8))',
-               dates_msg='Data collection: 2022-10-08 to 2022-10-27 (ongoing)',
-               date_range=['2022-10-08',    # the first full *day* of data collection
-                           '2022-10-11'],
-               default_res='1_hour',
-              )
-
-site_list = [site_01, site_02, site_03]
\ No newline at end of file
+import json
+import os
+
+sites_file = os.environ.get('SITES_FILE', './data/sites.json')
+
+site_keys = ['site_url', 'site_title', 'data_file_name', 'weather_file_name', 'note_file_name',
+             'config_direction', 'loc_msg_markdown', 'dates_msg', 'date_range', 'default_res']
+
+
+# A function to load the list of sites from a json file
+def load_sites(path):
+
+    with open(path, encoding='utf-8') as f:
+        site_list = json.load(f)
+
+    urls = set()
+
+    for site in site_list:
+
+        missing = [key for key in site_keys if key not in site]
+
+        if missing:
+            raise ValueError('{}: site {} has no {}'.format(path, site.get('site_url'), ', '.join(missing)))
+
+        if site['site_url'] in urls:
+            raise ValueError('{}: site {} is listed twice'.format(path, site['site_url']))
+
+        urls.add(site['site_url'])
+
+    return site_list
+
+
+site_list = load_sites(sites_file)
@@ -1,26 +1,26 @@
 # a collection of utility functions
-import numpy as np
-import pandas as pd
-import config
-
-# A function to prossess the raw data from bike counter to a pandas dataframe
-def df_process(data_file_name, date_range):
+import lazyimport
 
-    path = './data/counter/' + data_file_name
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
 
-    df = pd.read_excel(path, names=['time', 'in', 'out'], skiprows=3)
+import config
+import counterseries
+import gaps
 
-    df['bi_direction'] = df['in'] + df['out']
+# A function to load the data from bike counter as a compact 15-min series (see counterseries.py),
+# with the slots in the gaps of the site (see gaps.py) marked as missing
+def counter_series(data_file_name, date_range, gap_list=()):
 
-    df['time'] = pd.to_datetime(df['time'])
+    series = counterseries.from_cache(data_file_name, date_range)   # cached 15-min slots of the date range, see datacache.py
 
-    df = df.set_index('time')
+    return gaps.mask(series, gap_list)
 
-    df = df[date_range[0]: date_range[1]]
 
-    df["2022-11-20":"2023-04-30"] = np.nan   # manually set the dates of no recording
+# A function to prossess the raw data from bike counter to a pandas dataframe
+def df_process(data_file_name, date_range, gap_list=()):
 
-    return df
+    return counterseries.to_frame(counter_series(data_file_name, date_range, gap_list))
 
 
 # A function to get the daily weather data
@@ -51,20 +51,34 @@ def note_data(note_file_name):
     return df_temp
 
 
-# A function to update the dataframe based on the specified resample rule and date range
-def df_update(df, rule, start_date, end_date, agg='sum'):
+# A function to get the daily weather data and its weekly and monthly averages
+def weather_pyramid(weather_file_name):
+
+    df_weather = weather_data(weather_file_name)
+
+    pyramid = {'D': df_weather}
+
+    for rule in pyramid_rules:
+
+        pyramid[rule] = df_resample(df_weather, rule, agg='mean')
+
+    return pyramid
+
+
+# A function to resample the dataframe with the specified resample rule
+def df_resample(df, rule, agg='sum'):
 
     if agg == 'sum':
 
         if rule == 'W':
 
-            df_resample = df.resample(rule, label='left').agg(pd.Series.sum, min_count=1)  # make sure the resample result of NAN is not zero but NAN.
+            df_resample = df.resample(rule, label='left').sum(min_count=1)  # make sure the resample result of NAN is not zero but NAN.
             df_resample.index = df_resample.index + pd.DateOffset(days=1)  # offset the index by a day
             # see the issue here: https://stackoverflow.com/questions/30989224/python-pandas-dataframe-resample-daily-data-to-week-by-mon-sun-weekly-definition/46712821#46712821
 
         else: 
 
-            df_resample = df.resample(rule).agg(pd.Series.sum, min_count=1)  # make sure the resample result of NAN is not zero but NAN.
+            df_resample = df.resample(rule).sum(min_count=1)  # make sure the resample result of NAN is not zero but NAN.
 
     elif agg == 'mean':
 
@@ -78,12 +92,171 @@ def df_update(df, rule, start_date, end_date, agg='sum'):
 
             df_resample = df.resample(rule).agg(pd.Series.mean)  # make sure the resample result of NAN is not zero but NAN.
 
-    df_filtered = df_resample[(df_resample.index.strftime("%Y-%m-%d") >= start_date) & 
-                              (df_resample.index.strftime("%Y-%m-%d") <= end_date)]
+    return df_resample
+
+
+# A function to find the positions of a date range in a sorted datetime index.
+# Both dates are inclusive ('YYYY-MM-DD' strings): the range ends right before
+# midnight of the day after end_date, like comparing the "%Y-%m-%d" strings.
+def date_range_slice(index, start_date, end_date):
+
+    start = index.searchsorted(pd.Timestamp(start_date), side='left')
+
+    stop = index.searchsorted(pd.Timestamp(end_date) + pd.Timedelta(days=1), side='left')
+
+    return slice(start, max(start, stop))
+
+
+# A function to select the rows of a dataframe (sorted by time) within the date range.
+# The result is a slice of the original dataframe, no data is copied.
+def df_select(df, start_date, end_date):
+
+    return df.iloc[date_range_slice(df.index, start_date, end_date)]
+
+
+# A function to filter the resampled dataframe to the date range
+def df_filter(df_resample, start_date, end_date):
+
+    df_filtered = df_select(df_resample, start_date, end_date)
+
+    weekday_names = np.array(config.weekday_list, dtype=object)
+
+    return df_filtered.assign(day_of_week=weekday_names[df_filtered.index.dayofweek])
+
+
+# A function to update the dataframe based on the specified resample rule and date range
+def df_update(df, rule, start_date, end_date, agg='sum'):
+
+    return df_filter(df_resample(df, rule, agg), start_date, end_date)
+
+
+# The coarser levels of the aggregate pyramid, resampled from the daily sums.
+# (The sub-daily levels are summed from the 15-min series of the selected dates
+# when needed, see counterseries.to_frame.)
+pyramid_rules = ['W',   # Monday-anchored weeks, see df_resample
+                 'M']
+
+
+# A function to precompute the sums of the daily dataframe at every coarser resample rule of the bar chart
+def build_pyramid(df_daily):
+
+    pyramid = {'D': df_daily}
+
+    for rule in pyramid_rules:
+
+        pyramid[rule] = df_resample(df_daily, rule)
+
+    return pyramid
+
+
+# A function to get the start of the period of a resample rule containing a time
+def period_start(time, rule):
+
+    if rule == 'W':
+        return time.normalize() - pd.Timedelta(days=time.dayofweek)   # Monday
+
+    if rule == 'M':
+        return time.normalize().replace(day=1)
+
+    return time.floor(rule)
+
+
+# A function to update the pyramid of sums after the data changed from a time on:
+# only the periods of each level from that time on are resampled again.
+def update_pyramid(pyramid, df_daily, since):
+
+    updated = {'D': df_daily}
+
+    for rule in pyramid_rules:
+
+        tail = df_resample(df_daily[period_start(since, rule):], rule)
+
+        head = pyramid[rule]
+
+        updated[rule] = pd.concat([head[head.index < tail.index[0]], tail]) if len(tail) else head
+
+    return updated
+
+
+# A function to build the daily fact table of a site: the daily sums aligned with the day
+# of week, the weather (and whether it rained) and the notes of each day, so that the daily
+# charts only slice it
+def daily_facts(df_daily, df_weather, df_notes):
+
+    weekday_names = np.array(config.weekday_list, dtype=object)
+
+    df = df_daily.assign(day_of_week=weekday_names[df_daily.index.dayofweek])
+
+    df = df.join(df_weather[['PRCP', 'TMAX', 'TMIN']]).join(df_notes[['notes']])
+
+    df['rained'] = (df['PRCP'] > 0).astype(int)   # days without precipitation data count as dry
+
+    return df
+
+
+# A function to limit the bars of a sub-daily bar chart (rows at a regular time step):
+# at most max_points bars between the window dates (the whole range if None) and a quarter
+# of that before and after it. Consecutive rows are grouped into buckets and only the peak
+# of each bucket is kept (a bar chart only shows the highest bar of each pixel anyway).
+# Returns the kept rows and the offset and width (ms) of their bars so that each bar covers
+# its whole bucket, or None if all the rows fit.
+def bar_lod(df, col, step, max_points, window=None):
+
+    if window is None:
+        bounds = [0, 0, len(df), len(df)]
+    else:
+        bounds = [0, *df.index.searchsorted([pd.Timestamp(window[0]), pd.Timestamp(window[1])]), len(df)]
+
+    budgets = [max_points // 4, max_points, max_points // 4]
+
+    parts = list(zip(bounds[:-1], bounds[1:], budgets))
+
+    if all(stop - first <= budget for first, stop, budget in parts):
+        return df, None
+
+    step_ms = step / pd.Timedelta(milliseconds=1)
+
+    kept, offset, width = [], [], []
+
+    for first, stop, budget in parts:
+
+        n = stop - first
+
+        if n <= 0:
+            continue
+
+        size = -(-n // max(budget, 1))   # rows per bucket
+
+        values = np.full(-(-n // size) * size, -np.inf)
+        values[:n] = np.nan_to_num(df[col].to_numpy(dtype=np.float64)[first:stop], nan=-np.inf)
+
+        starts = np.arange(0, n, size)
+
+        peaks = starts + values.reshape(-1, size).argmax(axis=1)
+
+        kept.append(peaks + first)
+        offset.append((starts - peaks - 0.5) * step_ms)   # bars are centered on their time
+        width.append((np.minimum(starts + size, n) - starts) * step_ms)
+
+    return df.iloc[np.concatenate(kept)], dict(offset=np.concatenate(offset), width=np.concatenate(width))
+
+
+# A function to pick at most max_points rows: all the rows to keep (a boolean array),
+# then a random sample (the same each time) of the other rows. Returns their positions in order.
+def sample_rows(keep, max_points):
+
+    positions = np.arange(len(keep))
+
+    if max_points is None or len(keep) <= max_points:
+        return positions
+
+    others = positions[~keep]
+
+    n = max(max_points - keep.sum(), 0)
 
-    df_filtered["day_of_week"] = df_filtered.index.strftime("%a")
+    sample = np.random.default_rng(0).choice(others, size=min(n, len(others)), replace=False)
 
-    return df_filtered
+    return np.sort(np.concatenate([positions[keep], sample]))
 
 
 # A function to convert rgb to rgba with transparency (alpha) value
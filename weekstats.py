@@ -0,0 +1,399 @@
+# Running aggregates of the hourly counts of a site by day of week and hour of day
+#
+# The hourly sums of each column are kept as a (days, 25) matrix: the 24 hours of
+# each day, then the day's total. Along with it, the cumulative count (of hours
+# with data) and sum are kept per day of week: row i of the cumulative arrays
+# adds day i to row i - 7. The means of any date range are then the differences
+# of two rows for each day of week, without grouping the hourly data again.
+# Quantiles (for the box plots) and standard deviations are computed for all
+# the hours or days of week at once from the rows of the matrix in the date range.
+#
+# For the summary table, the daily totals are also cumulated day by day (the
+# total and the number of days with data of a date range are then two lookups),
+# and the busiest day and hour of a date range are looked up in range maximum
+# tables of the daily totals and of the busiest hour of each day.
+#
+# The counts are whole numbers, so they are kept in the smallest types holding
+# them exactly: the matrices in float32 (NaN for the hours without data) unless
+# a sum reaches 2**24, the cumulative counts and sums in unsigned ints (see
+# datacache.count_dtype), as well as the positions of the range maximum tables.
+
+import lazyimport
+
+np = lazyimport.module('numpy')
+pd = lazyimport.module('pandas')
+
+import config
+import counterseries
+import datacache
+
+hours = 24
+
+columns = counterseries.columns
+
+
+# A function to build the statistics of a site from its 15-min series
+def build(series):
+
+    return _extend(None, series, 0)
+
+
+# A function to update the statistics of a site after its 15-min series changed from a
+# time on: only the days from that time on are summed again, and the cumulative arrays
+# and range maximum tables are extended from the ones of the previous days
+def update(stats, series, since):
+
+    first = min(max((pd.Timestamp(since).normalize() - stats['start']).days, 0), stats['days'])
+
+    return _extend(stats, series, first)
+
+
+# A function to compute the statistics of the days from a day (row) on, keeping the
+# rows of the days before it from the previous statistics (None to build them all)
+def _extend(stats, series, first):
+
+    start = series['start'].normalize()
+
+    df_hourly = counterseries.to_frame(series, 'H', start + pd.Timedelta(days=first), start + series['slots'] * series['step'])
+
+    n = len(df_hourly) // hours   # days computed again
+
+    result = dict(start=start,
+                  days=first + n,
+                  matrix={},
+                  cumulative={},
+                  prefix={},
+                  peaks={})
+
+    for col in columns:
+
+        by_hour = df_hourly[col].to_numpy()[:n * hours].reshape(n, hours)
+
+        total = counterseries.bin_sum(by_hour.ravel(), hours)   # NaN if the day has no data
+
+        matrix = np.column_stack([by_hour, total])
+
+        valid = ~np.isnan(matrix)
+
+        values = np.where(valid, matrix, 0).astype(np.int64)
+
+        busiest_hour = np.where(valid[:, :hours], by_hour, -np.inf).max(axis=1, initial=-np.inf)
+
+        if stats is None:
+            previous = dict(matrix=np.zeros((0, hours + 1)),
+                            cumulative={name: np.zeros((7, hours + 1), dtype=np.int64) for name in ['count', 'sum']},
+                            prefix={name: np.zeros(1, dtype=np.int64) for name in ['count', 'sum']},
+                            peaks={'day': None, 'hour': None})
+        else:
+            previous = {name: stats[name][col] for name in ['matrix', 'cumulative', 'prefix', 'peaks']}
+
+        result['matrix'][col] = _compact_sums(np.concatenate([previous['matrix'][:first], matrix]))
+
+        cumulative = previous['cumulative']
+
+        result['cumulative'][col] = {name: _compact_counts(np.concatenate([cumulative[name][:first], _cumulate_by_weekday(a, cumulative[name][first:first + 7])]))
+                                     for name, a in [('count', valid.astype(np.int64)), ('sum', values)]}
+
+        prefix = previous['prefix']
+
+        result['prefix'][col] = {name: _compact_counts(np.concatenate([prefix[name][:first + 1], prefix[name][first] + np.cumsum(a[:, hours])]))
+                                 for name, a in [('count', valid.astype(np.int64)), ('sum', values)]}
+
+        result['peaks'][col] = {'day': _range_max_table(total, previous['peaks']['day'], first),
+                                'hour': _range_max_table(busiest_hour, previous['peaks']['hour'], first)}
+
+    return result
+
+
+# A function to keep the hourly or daily sums of a matrix in float32 when they are below 2**24
+# (float32 holds the whole numbers up to there exactly)
+def _compact_sums(a):
+
+    return a.astype(np.float32) if np.nanmax(a, initial=0) < 2 ** 24 else a.astype(np.float64)
+
+
+# A function to keep cumulative counts or sums in the smallest unsigned int type holding them
+def _compact_counts(a):
+
+    return a.astype(datacache.count_dtype(a))
+
+
+# A function to build the range maximum table of an array: level k holds, for each position,
+# the index of the largest of the 2**k values from there (the first one on ties, NaN never wins).
+# With the table of a previous array, `a` holds the values from position `first` on, and only
+# the entries reaching them are computed again.
+def _range_max_table(a, table=None, first=0):
+
+    values = np.where(np.isnan(a), -np.inf, a)
+
+    if table is None:
+        first = 0
+    else:
+        values = np.concatenate([table['values'][:first], values])
+
+    values = _compact_sums(values)
+
+    levels = [_compact_counts(np.arange(len(values)))]
+
+    width = 1
+
+    while 2 * width <= len(values):
+
+        keep = max(first - 2 * width + 1, 0)   # the entries before it only cover previous values
+
+        left, right = levels[-1][keep:-width], levels[-1][keep + width:]
+
+        head = table['levels'][len(levels)][:keep] if keep else levels[0][:0]
+
+        levels.append(np.concatenate([head, np.where(values[right] > values[left], right, left)]))
+
+        width *= 2
+
+    return dict(values=values, levels=levels)
+
+
+# A function to find the index of the largest value of an array in the positions first:stop
+# from its range maximum table (two overlapping lookups), None if there is no value
+def _range_argmax(table, first, stop):
+
+    if first >= stop:
+        return None
+
+    level = (stop - first).bit_length() - 1
+
+    left = table['levels'][level][first]
+    right = table['levels'][level][stop - 2 ** level]
+
+    index = right if table['values'][right] > table['values'][left] else left
+
+    return index if table['values'][index] > -np.inf else None
+
+
+# A function to cumulate the rows of an array 7 by 7 (row i + 7 holds the sum of rows i, i - 7, ...),
+# starting from the 7 rows of a base (zeros by default)
+def _cumulate_by_weekday(a, base=None):
+
+    result = np.zeros((len(a) + 7, a.shape[1]), dtype=np.int64)
+
+    if base is not None:
+        result[:7] = base
+
+    for first in range(7):
+        result[first + 7::7] = result[first] + np.cumsum(a[first::7], axis=0)
+
+    return result
+
+
+# A function to get the memory used by the statistics of a site, in bytes
+def nbytes(stats):
+
+    def size(obj):
+        if isinstance(obj, dict):
+            return sum(size(value) for value in obj.values())
+        if isinstance(obj, list):
+            return sum(size(value) for value in obj)
+        return getattr(obj, 'nbytes', 0)
+
+    return sum(size(stats[name]) for name in ['matrix', 'cumulative', 'prefix', 'peaks'])
+
+
+# A function to get the rows (days) of a date range (both dates included)
+def day_rows(stats, start_date, end_date):
+
+    first = (pd.Timestamp(start_date) - stats['start']).days
+    stop = (pd.Timestamp(end_date) - stats['start']).days + 1
+
+    first = min(max(first, 0), stats['days'])
+    stop = min(max(stop, first), stats['days'])
+
+    return first, stop
+
+
+# A function to get the count of hours with data and the sum of a column over a date
+# range, as (7, 25) arrays: Monday to Sunday, by hour of day then total
+def aggregates(stats, col, start_date, end_date):
+
+    first, stop = day_rows(stats, start_date, end_date)
+
+    starts = first + np.arange(7)
+
+    # the last day of the range with the same day of week as each of the first 7 days
+    lasts = starts + (stop - 1 - starts) // 7 * 7
+
+    has_days = starts < stop
+
+    weekdays = (stats['start'].dayofweek + starts) % 7
+
+    result = {}
+
+    for name, cumulative in stats['cumulative'][col].items():
+
+        totals = np.where(has_days[:, None], cumulative[np.where(has_days, lasts, 0) + 7] - cumulative[starts], 0)
+
+        result[name] = np.zeros((7, hours + 1))
+        result[name][weekdays] = totals
+
+    return result
+
+
+# A function to get the mean of a column by day of week and hour of day (then daily total)
+# over a date range, as a (7, 25) array (NaN where there is no data)
+def mean(stats, col, start_date, end_date):
+
+    agg = aggregates(stats, col, start_date, end_date)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return agg['sum'] / agg['count']
+
+
+# A function to get the standard deviation of a column by day of week and hour of day
+# (then daily total) over a date range, as a (7, 25) array (NaN where there is no data).
+# The dashboard does not show it, so it is computed from the rows of the matrix instead
+# of keeping cumulative sums of squares.
+def std(stats, col, start_date, end_date):
+
+    matrix, day_of_week = rows(stats, col, start_date, end_date)
+
+    result = np.full((7, hours + 1), np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        for day in range(7):
+
+            a = matrix[day_of_week == day]
+
+            count = (~np.isnan(a)).sum(axis=0)
+
+            deviation = a - np.nansum(a, axis=0) / count
+
+            result[day] = np.sqrt(np.nansum(deviation ** 2, axis=0) / count)
+
+    return result
+
+
+# A function to get the total of a column and the number of days with data over a date range
+def total(stats, col, start_date, end_date):
+
+    first, stop = day_rows(stats, start_date, end_date)
+
+    prefix = stats['prefix'][col]
+
+    return (np.float64(prefix['sum'][stop]) - prefix['sum'][first],
+            np.float64(prefix['count'][stop]) - prefix['count'][first])
+
+
+# A function to get the average daily total of a column on weekdays and on weekends over a date range
+def weekday_weekend_means(stats, col, start_date, end_date):
+
+    agg = aggregates(stats, col, start_date, end_date)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (agg['sum'][:5, hours].sum() / agg['count'][:5, hours].sum(),
+                agg['sum'][5:, hours].sum() / agg['count'][5:, hours].sum())
+
+
+# A function to find the busiest day of a column over a date range: (day, total), None without data
+def peak_day(stats, col, start_date, end_date):
+
+    first, stop = day_rows(stats, start_date, end_date)
+
+    day = _range_argmax(stats['peaks'][col]['day'], first, stop)
+
+    if day is None:
+        return None
+
+    return stats['start'] + pd.Timedelta(days=int(day)), np.float64(stats['matrix'][col][day, hours])
+
+
+# A function to find the busiest hour of a column over a date range: (start of the hour, count),
+# None without data
+def peak_hour(stats, col, start_date, end_date):
+
+    first, stop = day_rows(stats, start_date, end_date)
+
+    day = _range_argmax(stats['peaks'][col]['hour'], first, stop)
+
+    if day is None:
+        return None
+
+    hour = int(np.nanargmax(stats['matrix'][col][day, :hours]))
+
+    return stats['start'] + pd.Timedelta(days=int(day), hours=hour), np.float64(stats['matrix'][col][day, hour])
+
+
+# A function to get the rows of the matrix of a column over a date range, only the days
+# of week in a list (of config.weekday_list names) if given, and the day of week of each row
+def rows(stats, col, start_date, end_date, weekdays=None):
+
+    first, stop = day_rows(stats, start_date, end_date)
+
+    day_of_week = (stats['start'].dayofweek + np.arange(first, stop)) % 7
+
+    matrix = stats['matrix'][col][first:stop].astype(np.float64)
+
+    if weekdays is not None:
+
+        keep = np.isin(day_of_week, [config.weekday_list.index(day) for day in weekdays])
+
+        matrix, day_of_week = matrix[keep], day_of_week[keep]
+
+    return matrix, day_of_week
+
+
+# A function to get the daily totals of a column over a date range as a (weeks, 7)
+# array, one column per day of week from Monday (NaN for the days outside the range)
+def daily_by_weekday(stats, col, start_date, end_date):
+
+    first, stop = day_rows(stats, start_date, end_date)
+
+    offset = (stats['start'].dayofweek + first) % 7   # day of week of the first day
+
+    weeks = -(-(offset + stop - first) // 7)
+
+    result = np.full(weeks * 7, np.nan)
+    result[offset:offset + stop - first] = stats['matrix'][col][first:stop, hours]
+
+    return result.reshape(weeks, 7)
+
+
+# A function to compute quantiles of each column of an array, ignoring the NaN values.
+# Interpolates between the sorted values like plotly.js does for box plots
+# (position q * n - 0.5), so the boxes look the same as when the browser computes them.
+def quantiles(a, q):
+
+    a = np.sort(a, axis=0)   # NaN last
+
+    count = (~np.isnan(a)).sum(axis=0)
+
+    if not len(a):
+        return np.full((len(q), a.shape[1]), np.nan)
+
+    position = np.clip(np.multiply.outer(q, count) - 0.5, 0, np.maximum(count - 1, 0))
+
+    below = np.floor(position).astype(int)
+    above = np.ceil(position).astype(int)
+
+    cols = np.arange(a.shape[1])
+
+    return (position - below) * a[above, cols] + (1 - (position - below)) * a[below, cols]
+
+
+# A function to compute the box plot statistics of each column of an array (NaN ignored):
+# count, q1, median, q3 and the whiskers, which end at the furthest values within
+# 1.5 interquartile ranges from the box
+def box_stats(a):
+
+    q1, median, q3 = quantiles(a, [0.25, 0.5, 0.75])
+
+    iqr = q3 - q1
+
+    with np.errstate(invalid='ignore'):
+        lowerfence = np.fmin(np.where(a >= q1 - 1.5 * iqr, a, np.inf).min(axis=0, initial=np.inf), q1)
+        upperfence = np.fmax(np.where(a <= q3 + 1.5 * iqr, a, -np.inf).max(axis=0, initial=-np.inf), q3)
+
+    return dict(count=(~np.isnan(a)).sum(axis=0),
+                q1=q1,
+                median=median,
+                q3=q3,
+                lowerfence=lowerfence,
+                upperfence=upperfence)